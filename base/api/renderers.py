@@ -0,0 +1,20 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON, one object per line. Views that support it
+    normally stream their rows instead of going through ``render()``;
+    this is mainly here so content negotiation can select it.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data.get('results', [data]) if isinstance(data, dict) else data
+        return ''.join(json.dumps(row, default=str) + '\n' for row in rows).encode()
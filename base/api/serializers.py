@@ -2,7 +2,17 @@ from rest_framework.serializers import ModelSerializer
 from base.models import Room
 
 
-class RoomSerializer(ModelSerializer):
+class DynamicFieldsModelSerializer(ModelSerializer):
+    """Takes an optional ``fields`` argument limiting which fields are serialized."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class RoomSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Room
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
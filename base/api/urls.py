@@ -2,5 +2,7 @@ from django.urls import path
 from . import views
 urlpatterns = [
     path('rooms/',views.getRooms, name = "getrooms"),
-    path('room/<str:pk>/',views.getSingleRoom , name ="getSingleRoom"),
+    path('room/<int:pk>/',views.getSingleRoom , name ="getSingleRoom"),
+    path('rooms/batch/',views.getRoomsBatch, name = "getRoomsBatch"),
+    path('messages/batch/',views.postMessagesBatch, name = "postMessagesBatch"),
 ]
\ No newline at end of file
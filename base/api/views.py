@@ -1,22 +1,199 @@
-from rest_framework.decorators import api_view
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_headers
+from django.views.decorators.http import condition
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
+from base.conditional import api_room_etag, cache_policy, room_last_modified
+from base.messaging import post_messages
 from base.models import Room
+from base.pagination import KeysetPaginator
+from .renderers import NDJSONRenderer
 from .serializers import RoomSerializer
+
+
+def requested_fields(request, serializer_class):
+    """
+    Field names from ``?fields=a,b,c``, restricted to the serializer's
+    fields; None (all fields) when the parameter is absent.
+    """
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    available = set(serializer_class().fields)
+    fields = [name for name in raw.split(',') if name in available]
+    return fields or None
+
+
+def room_queryset(fields):
+    """Rooms loading only the columns and relations ``fields`` needs."""
+    rooms = Room.objects.all()
+    if fields is None:
+        return rooms.prefetch_related('participants')
+    # Keyset pagination needs the ordering columns even if not serialized.
+    columns = {'id', 'updated', 'created'}
+    columns.update(name for name in fields if name != 'participants')
+    rooms = rooms.only(*columns)
+    if 'participants' in fields:
+        rooms = rooms.prefetch_related('participants')
+    return rooms
+
+
+def page_size(request):
+    try:
+        size = int(request.query_params.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        size = settings.API_PAGE_SIZE
+    return min(max(size, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def stream_ndjson(queryset, serializer):
+    """
+    Stream one JSON object per row. ``iterator()`` uses a server-side
+    cursor where the database has one and prefetches per chunk, so memory
+    use stays flat however many rows there are.
+    """
+    def rows():
+        for obj in queryset.iterator(chunk_size=settings.API_STREAM_CHUNK_SIZE):
+            yield json.dumps(serializer.to_representation(obj), default=str) + '\n'
+    return StreamingHttpResponse(rows(), content_type=NDJSONRenderer.media_type)
+
+
+@cache_control(**cache_policy('api-rooms'))
+# JSON or NDJSON depending on Accept, so shared caches must key on it.
+@vary_on_headers('Accept')
 @api_view(['GET'])
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer, NDJSONRenderer])
 def getRooms(request):
-    rooms = Room.objects.all()
-    # here RoomSerializer takes one objects but here we are passing list of objects therefore we need to keep many = True
-    serializer = RoomSerializer(rooms,many=True)
-    return Response(serializer.data)
+    fields = requested_fields(request, RoomSerializer)
+    rooms = room_queryset(fields)
+
+    # ?format=ndjson (or Accept: application/x-ndjson) streams every room.
+    if request.accepted_renderer.format == 'ndjson':
+        return stream_ndjson(rooms.order_by('-updated', '-created', '-pk'), RoomSerializer(fields=fields))
+
+    # Otherwise one keyset page at a time; prefetching only covers the page's rows.
+    page = KeysetPaginator(rooms, page_size(request)).page(request.query_params.get('cursor'))
+    serializer = RoomSerializer(page.object_list, many=True, fields=fields)
 
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.query_params.copy()
+        params['cursor'] = cursor
+        return request.build_absolute_uri(f"{reverse('getrooms')}?{params.urlencode()}")
 
+    return Response({
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+        'results': serializer.data,
+    })
 
+
+
+# A matching If-None-Match/If-Modified-Since is answered with a 304
+# before the room is loaded or serialized.
+@cache_control(**cache_policy('api-room'))
+@condition(etag_func=api_room_etag, last_modified_func=room_last_modified)
 @api_view(['GET'])
 def getSingleRoom(request,pk):
-    room = Room.objects.get(id=pk)
+    room = get_object_or_404(Room, id=pk)
     # Taking one Object and returning information about that object through api
-    serializer = RoomSerializer(room,many=False)
+    serializer = RoomSerializer(room, many=False, fields=requested_fields(request, RoomSerializer))
     return Response(serializer.data)
 
 
-    
\ No newline at end of file
+def parse_ids(raw):
+    """Split '1,2,3' into a de-duplicated list of ids, keeping their order."""
+    return list(dict.fromkeys(part.strip() for part in raw.split(',') if part.strip()))
+
+
+def to_pk(value):
+    """A room id as sent by the client ("01", 1) as an int, or None if it is not one."""
+    value = str(value).strip()
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+@api_view(['GET'])
+def getRoomsBatch(request):
+    """
+    Many rooms by id in one query: ``?ids=1,2,3`` (plus ``?fields=``).
+    Results come back in the requested order, with an error entry for every
+    id that does not exist.
+    """
+    ids = parse_ids(request.query_params.get('ids', ''))
+    if not ids:
+        return Response({'detail': 'Pass the room ids as ?ids=1,2,3.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.API_MAX_BATCH_SIZE:
+        return Response(
+            {'detail': f'At most {settings.API_MAX_BATCH_SIZE} ids per request.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    fields = requested_fields(request, RoomSerializer)
+    pks = {room_id: to_pk(room_id) for room_id in ids}
+    rooms = room_queryset(fields).filter(pk__in=[pk for pk in pks.values() if pk is not None])
+    found = {room.pk: room for room in rooms}
+    serializer = RoomSerializer(fields=fields)
+    results = [
+        {'id': room_id, 'room': serializer.to_representation(found[pks[room_id]])} if pks[room_id] in found
+        else {'id': room_id, 'error': 'Room not found.'}
+        for room_id in ids
+    ]
+    return Response({'results': results})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def postMessagesBatch(request):
+    """
+    Post many messages as the current user in one transaction::
+
+        {"messages": [{"room": 1, "body": "..."}, ...]}
+
+    Each item gets a result in the same position: the created message's id,
+    or the reason it was rejected. Valid items are stored even if others fail.
+    """
+    items = request.data.get('messages') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'detail': 'Expected {"messages": [...]}.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > settings.API_MAX_BATCH_SIZE:
+        return Response(
+            {'detail': f'At most {settings.API_MAX_BATCH_SIZE} messages per request.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    room_ids = {to_pk(item.get('room')) for item in items if isinstance(item, dict)}
+    rooms = {room.pk: room for room in Room.objects.filter(pk__in=room_ids - {None})}
+
+    results, accepted = [None] * len(items), []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[position] = {'error': 'Each message must be an object.'}
+            continue
+        room = rooms.get(to_pk(item.get('room')))
+        body = item.get('body')
+        if room is None:
+            results[position] = {'error': 'Room not found.'}
+        elif not isinstance(body, str) or not body.strip():
+            results[position] = {'error': 'Message body is required.'}
+        else:
+            accepted.append((position, room, body))
+
+    if accepted:
+        with transaction.atomic():
+            messages = post_messages([(request.user, room, body) for _position, room, body in accepted])
+        for (position, _room, _body), message in zip(accepted, messages):
+            results[position] = {'id': message.pk, 'room': message.room_id}
+
+    code = status.HTTP_201_CREATED if accepted else status.HTTP_400_BAD_REQUEST
+    return Response({'results': results}, status=code)
@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        # Connect signal handlers (search index, counters, caches).
+        from . import checks, signals  # noqa: F401
+        from .metrics import install_query_timer
+        from .sqlite import configure_connection
+        from .utils import profanity_pattern
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_timer)
+
+        # Compile the profanity matcher now rather than on the first request.
+        profanity_pattern()
@@ -0,0 +1,100 @@
+"""
+Hot/cold partitioning of messages.
+
+``Message`` holds recent messages only. ``archive()`` moves everything
+older than ``MESSAGE_ARCHIVE_AFTER_DAYS`` into ``ArchivedMessage``, in
+batches of ``batch_size`` rows, each batch in its own transaction.
+Moving a message is not deleting it: the rows are removed with a plain
+DELETE so no delete signals fire, and Room.message_count keeps counting
+archived messages. Activity views only ever read the hot table; room
+history falls through to the archive via ``KeysetPaginator(older=...)``.
+
+Archived messages can still be deleted by their authors, and pending ones
+are still moderated (``base.moderation`` covers both tables). They do
+leave the message search index: message search only serves the activity
+page, which lists hot messages. Rooms stay searchable as before.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import fragments, search
+from .models import ArchivedMessage, Message
+
+FIELDS = ('id', 'user_id', 'room_id', 'body', 'moderation_status', 'updated', 'created')
+
+
+def cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'MESSAGE_ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive(before=None, batch_size=1000, using='default'):
+    """Move messages created before ``before`` (default: ``cutoff()``) to the archive. Returns the count."""
+    before = before or cutoff()
+    total = 0
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(
+                Message.objects.using(using).filter(created__lt=before)
+                .order_by('pk').values(*FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            ArchivedMessage.objects.using(using).bulk_create(
+                [ArchivedMessage(**row) for row in rows], ignore_conflicts=True,
+            )
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {Message._meta.db_table} WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids,
+                )
+            search.unindex_messages(ids, using=using)
+        total += len(rows)
+    if total:
+        fragments.bump(fragments.MESSAGES, fragments.ARCHIVE, using=using)
+    return total
+
+
+def _table_bytes(connection, table):
+    """On-disk size of a table and its indexes, or None if the database cannot tell."""
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN '
+                    '(SELECT name FROM sqlite_master WHERE type = %s AND tbl_name = %s)',
+                    [table, 'index', table],
+                )
+            else:
+                return None
+            return cursor.fetchone()[0]
+    except Exception:
+        # SQLite builds without the dbstat virtual table.
+        return None
+
+
+def partition_sizes(using='default'):
+    """Rows, oldest and newest ``created`` and bytes for the hot and cold partitions."""
+    connection = connections[using]
+    sizes = []
+    for name, model in (('hot', Message), ('archive', ArchivedMessage)):
+        queryset = model.objects.using(using).order_by()
+        oldest = queryset.order_by('created').values_list('created', flat=True).first()
+        newest = queryset.order_by('-created').values_list('created', flat=True).first()
+        sizes.append({
+            'partition': name,
+            'table': model._meta.db_table,
+            'rows': queryset.count(),
+            'oldest': oldest,
+            'newest': newest,
+            'bytes': _table_bytes(connection, model._meta.db_table),
+        })
+    return sizes
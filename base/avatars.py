@@ -0,0 +1,119 @@
+"""
+Avatar thumbnails.
+
+When a user uploads an avatar, a worker pool renders fixed-size square
+variants in WebP and JPEG and stores them under a directory named after a
+hash of the uploaded file's contents, e.g. ``avatars/<hash>/small.webp``.
+Since the name changes whenever the content does, the variants can be
+served with a far-future cache lifetime. Templates pick a variant with the
+``avatar`` filter from ``base/templatetags/avatars.py``.
+"""
+
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import fragments
+
+logger = logging.getLogger(__name__)
+
+# Edge length in pixels, about twice the CSS size of .avatar--small/medium/large.
+SIZES = {
+    'small': 64,
+    'medium': 96,
+    'large': 256,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+            thread_name_prefix='avatars',
+        )
+    return _executor
+
+
+def variant_name(content_hash, size, fmt='webp'):
+    return f'avatars/{content_hash}/{size}.{fmt}'
+
+
+def variant_url(content_hash, size, fmt='webp'):
+    return default_storage.url(variant_name(content_hash, size, fmt))
+
+
+def avatar_for(user, size='small', fmt='webp'):
+    """Thumbnail URL for ``user``, or ``user.avatar_url`` until thumbnails exist."""
+    if size in SIZES and fmt in FORMATS and getattr(user, 'avatar_hash', ''):
+        return variant_url(user.avatar_hash, size, fmt)
+    return user.avatar_url
+
+
+def render_variants(data):
+    """
+    Render every size/format variant of the image bytes ``data``. Returns
+    (content_hash, {name: bytes}).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()[:20]
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        variants = {}
+        for size, pixels in SIZES.items():
+            thumbnail = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+            for fmt, (pil_format, options) in FORMATS.items():
+                out = thumbnail.convert('RGB') if pil_format == 'JPEG' else thumbnail
+                buffer = io.BytesIO()
+                out.save(buffer, pil_format, **options)
+                variants[variant_name(content_hash, size, fmt)] = buffer.getvalue()
+    return content_hash, variants
+
+
+def process_avatar(user_id, avatar_name):
+    """
+    Build the variants for ``avatar_name`` and record their hash on the user,
+    unless the user has uploaded a different avatar in the meantime.
+    """
+    from .models import User, avatar_cache_key
+
+    close_old_connections()
+    try:
+        with default_storage.open(avatar_name, 'rb') as source:
+            data = source.read()
+        content_hash, variants = render_variants(data)
+        for name, content in variants.items():
+            # Content addressed: an existing file already has these bytes.
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(content))
+        User.objects.filter(pk=user_id, avatar=avatar_name).update(avatar_hash=content_hash)
+        cache.delete(avatar_cache_key(user_id))
+        fragments.bump(fragments.USERS)
+        return content_hash
+    except Exception:
+        logger.exception(f"Avatar processing failed for user {user_id}")
+        return None
+    finally:
+        close_old_connections()
+
+
+def schedule(user):
+    """Queue variant generation for ``user``'s avatar once the current transaction commits."""
+    if not user.avatar:
+        return
+    user_id, avatar_name = user.pk, user.avatar.name
+    transaction.on_commit(lambda: get_executor().submit(process_avatar, user_id, avatar_name))
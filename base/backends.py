@@ -0,0 +1,34 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+from . import hashing
+from .models import User
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend with the password check run in ``base.hashing``'s pool.
+
+    A failed email/password check raises PermissionDenied, which stops
+    ``authenticate()`` there. Otherwise the later backends would hash the
+    same wrong password again, each one synchronously.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so a missing account takes as long as a wrong password.
+            hashing.make_password(password)
+            raise PermissionDenied
+        is_correct, must_update = hashing.check_password(password, user.password)
+        if not (is_correct and self.user_can_authenticate(user)):
+            raise PermissionDenied
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        return user
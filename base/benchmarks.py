@@ -0,0 +1,236 @@
+"""
+Per-view performance budgets.
+
+Every view in ``base/urls.py`` and ``base/api/urls.py`` has a ``Case``
+below with a budget: how many SQL queries it may send, its median wall
+time and the peak memory allocated while handling one request. ``run()``
+requests each case against the current database, normally a dataset from
+``manage.py generate_data``, and returns a JSON-serializable report.
+``compare()`` diffs a report against a stored baseline.
+
+Caches are cleared before every request, so a cached fragment cannot hide
+an N+1, and each request runs in a transaction that is rolled back, so
+POST cases leave the dataset as it was.
+"""
+
+import statistics
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Message, Room, Topic, User
+
+METRICS = ('queries', 'ms', 'kb')
+# `manage.py generate_data` options of the dataset the budgets and baseline are for.
+REFERENCE_DATASET = {'users': 2000, 'rooms': 1000, 'messages': 50_000, 'seed': 1}
+
+
+class Budget:
+    def __init__(self, queries, ms, kb):
+        self.queries = queries
+        self.ms = ms
+        self.kb = kb
+
+    def as_dict(self):
+        return {metric: getattr(self, metric) for metric in METRICS}
+
+
+class Case:
+    """
+    One request to benchmark. ``path`` and ``data`` are callables taking the
+    ``Fixtures``; ``prepare`` runs inside the rolled-back transaction first.
+    """
+
+    def __init__(self, name, path, budget, method='get', data=None, anonymous=False, prepare=None,
+                 content_type=None):
+        self.name = name
+        self.path = path
+        self.budget = budget
+        self.method = method
+        self.data = data
+        self.anonymous = anonymous
+        self.prepare = prepare
+        self.content_type = content_type
+
+
+class Fixtures:
+    """The rows the cases request: the busiest room and its host."""
+
+    def __init__(self):
+        self.room = Room.objects.exclude(host=None).order_by('-message_count', 'pk').first()
+        if self.room is None:
+            raise LookupError("The benchmarks need a dataset; run `manage.py generate_data` first.")
+        self.user = self.room.host
+        self.topic = self.room.topic
+        self.message = None
+        self.room_ids = ','.join(str(pk) for pk in Room.objects.order_by('-updated').values_list('pk', flat=True)[:20])
+
+
+def _make_staff(fixtures):
+    User.objects.filter(pk=fixtures.user.pk).update(is_staff=True)
+
+
+def _own_message(fixtures):
+    fixtures.message = Message.objects.create(user=fixtures.user, room=fixtures.room, body='benchmark')
+
+
+# Budget(queries, ms, kb). Query counts must not grow with the data; times and
+# memory are for the reference dataset, REFERENCE_DATASET below.
+CASES = [
+    # base/urls.py
+    Case('index', lambda f: reverse('index'), Budget(6, 60, 1024)),
+    Case('index_search', lambda f: reverse('index') + f'?q={f.topic.name.split()[0]}', Budget(8, 250, 1024)),
+    Case('login', lambda f: reverse('login'), Budget(0, 20, 256), anonymous=True),
+    Case('logout', lambda f: reverse('logout'), Budget(4, 20, 256)),
+    Case('register', lambda f: reverse('register'), Budget(0, 20, 256), anonymous=True),
+    Case('room', lambda f: reverse('room', args=[f.room.pk]), Budget(8, 400, 6144)),
+    Case('room_post', lambda f: reverse('room', args=[f.room.pk]), Budget(9, 50, 256),
+         method='post', data=lambda f: {'message_body': 'benchmark message'}),
+    Case('room_history', lambda f: reverse('room-history', args=[f.room.pk]), Budget(2, 30, 1024)),
+    Case('room_messages_since', lambda f: reverse('room-messages-since', args=[f.room.pk]), Budget(2, 40, 1024)),
+    # Only up to the response headers; the stream itself is long-lived.
+    Case('room_events', lambda f: reverse('room-events', args=[f.room.pk]), Budget(1, 20, 256)),
+    Case('user_profile', lambda f: reverse('user-profile', args=[f.user.pk]), Budget(6, 60, 1024)),
+    Case('update_user', lambda f: reverse('update_user', args=[f.user.pk]), Budget(3, 20, 256)),
+    Case('setting', lambda f: reverse('setting'), Budget(2, 20, 256)),
+    Case('create_room', lambda f: reverse('create-room'), Budget(3, 30, 512)),
+    Case('update_room', lambda f: reverse('update-room', args=[f.room.pk]), Budget(6, 30, 512)),
+    Case('delete_room', lambda f: reverse('delete-room', args=[f.room.pk]), Budget(4, 20, 256)),
+    Case('delete_message', lambda f: reverse('delete-message', args=[f.message.pk]), Budget(4, 20, 256),
+         prepare=_own_message),
+    Case('activity_page', lambda f: reverse('activity-page'), Budget(3, 30, 512)),
+    Case('topic_page', lambda f: reverse('topic-page'), Budget(3, 30, 512)),
+    Case('back', lambda f: reverse('back'), Budget(0, 10, 128)),
+    Case('moderation_metrics', lambda f: reverse('moderation-metrics'), Budget(6, 20, 256),
+         prepare=_make_staff),
+    Case('metrics', lambda f: reverse('metrics'), Budget(0, 20, 512), anonymous=True),
+    # base/api/urls.py
+    Case('api_rooms', lambda f: reverse('getrooms'), Budget(4, 400, 12288)),
+    Case('api_room', lambda f: reverse('getSingleRoom', args=[f.room.pk]), Budget(5, 80, 2048)),
+    Case('api_rooms_batch', lambda f: reverse('getRoomsBatch') + f'?ids={f.room_ids}', Budget(4, 250, 8192)),
+    Case('api_messages_batch', lambda f: reverse('postMessagesBatch'), Budget(11, 40, 512), method='post',
+         content_type='application/json',
+         data=lambda f: {'messages': [{'room': f.room.pk, 'body': f'benchmark {i}'} for i in range(20)]}),
+]
+
+
+def _host():
+    """A host name ALLOWED_HOSTS accepts, since this does not run under the test runner."""
+    for host in settings.ALLOWED_HOSTS:
+        return 'localhost' if host == '*' else host.lstrip('.')
+    return 'localhost'
+
+
+def _request(case, fixtures, session_key):
+    # A fresh client per request: a case such as logout may end its session.
+    client = Client(HTTP_HOST=_host())
+    if not case.anonymous:
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    kwargs = {}
+    if case.data is not None:
+        kwargs['data'] = case.data(fixtures)
+    if case.content_type:
+        kwargs['content_type'] = case.content_type
+    response = getattr(client, case.method)(case.path(fixtures), **kwargs)
+    response.close()
+    return response.status_code
+
+
+def _measure(case, fixtures, session_key, trace=False):
+    """Request ``case`` once in a rolled-back transaction; returns (status, queries, seconds, peak bytes)."""
+    with transaction.atomic():
+        if case.prepare:
+            case.prepare(fixtures)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            if trace:
+                tracemalloc.start()
+            started = time.perf_counter()
+            try:
+                status = _request(case, fixtures, session_key)
+            finally:
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1] if trace else 0
+                if trace:
+                    tracemalloc.stop()
+        transaction.set_rollback(True)
+    return status, len(queries), elapsed, peak
+
+
+def dataset():
+    """Row counts of the dataset a report was taken on."""
+    return {
+        'users': User.objects.count(),
+        'topics': Topic.objects.count(),
+        'rooms': Room.objects.count(),
+        'messages': Message.objects.count(),
+        'busiest_room_messages': Room.objects.order_by('-message_count').values_list('message_count', flat=True).first(),
+    }
+
+
+def run(cases=None, repeat=5, timing=True):
+    """
+    Benchmark ``cases`` (all of CASES by default). After a warm-up request,
+    query counts and peak memory come from a traced request and wall time
+    is the median of ``repeat`` more. With ``timing=False`` only queries
+    are measured.
+    """
+    fixtures = Fixtures()
+    login = Client()
+    login.force_login(fixtures.user)
+    session_key = login.session.session_key
+    views = {}
+    for case in cases or CASES:
+        # Warm up first so one-off work (template compilation, lazy imports) is not counted.
+        _measure(case, fixtures, session_key)
+        status, queries, _elapsed, peak = _measure(case, fixtures, session_key, trace=timing)
+        times = [_measure(case, fixtures, session_key)[2] for _ in range(repeat if timing else 0)]
+        views[case.name] = {
+            'status': status,
+            'queries': queries,
+            'ms': round(statistics.median(times) * 1000, 2) if times else None,
+            'kb': round(peak / 1024, 1) if timing else None,
+            'budget': case.budget.as_dict(),
+        }
+    return {'dataset': dataset(), 'views': views}
+
+
+def over_budget(report):
+    """(view, metric, value, budget) for every measured metric above its budget."""
+    return [
+        (name, metric, row[metric], row['budget'][metric])
+        for name, row in report['views'].items()
+        for metric in METRICS
+        if row[metric] is not None and row[metric] > row['budget'][metric]
+    ]
+
+
+def compare(report, baseline):
+    """
+    Diff ``report`` against ``baseline``: (view, metric, before, after) for
+    every metric of the reported views that changed. ``before`` is None for
+    views new since the baseline.
+    """
+    changes = []
+    before_views = baseline.get('views', {})
+    for name, after in report['views'].items():
+        before = before_views.get(name, {})
+        for metric in METRICS:
+            if before.get(metric) != after[metric]:
+                changes.append((name, metric, before.get(metric), after[metric]))
+    return changes
+
+
+def query_regressions(report, baseline):
+    """Views that now send more queries than in ``baseline``; query counts do not depend on the machine."""
+    return [
+        (name, 'queries', before, after)
+        for name, metric, before, after in compare(report, baseline)
+        if metric == 'queries' and before is not None and after is not None and after > before
+    ]
@@ -0,0 +1,165 @@
+"""
+Per-room publish/subscribe for real-time delivery.
+
+``InProcessBroker`` fans messages out to the WebSocket connections served by
+this process and is the default. ``RedisBroker`` relays through Redis
+pub/sub so every worker process sees every message; point it at any Redis
+compatible server (a local ``redis-server`` works for testing) or pass
+in client objects directly.
+
+Select the backend with the ``REALTIME_BROKER`` setting::
+
+    REALTIME_BROKER = {
+        'BACKEND': 'base.broker.RedisBroker',
+        'OPTIONS': {'url': 'redis://localhost:6379/0'},
+    }
+"""
+
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    A bounded queue of messages for one connection. When a slow client lets
+    it fill up, the oldest message is dropped rather than blocking publishers.
+    """
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        # Publishers may run in a worker thread, so hop onto the loop.
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            self.broker.unsubscribe(self)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    async def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def has_subscribers(self, channel):
+        return channel in self._subscribers
+
+    def publish(self, channel, message):
+        """Deliver ``message`` (a JSON-serializable dict) to every local subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+class RedisBroker:
+    """
+    Cross-process broker on Redis pub/sub. Each process keeps one pub/sub
+    connection, subscribes to a room channel while it has local listeners,
+    and hands incoming messages to an in-process broker for fan-out.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='whispersphere:', queue_size=100,
+                 client=None, async_client=None):
+        if client is None or async_client is None:
+            import redis
+            import redis.asyncio
+            client = client or redis.Redis.from_url(url)
+            async_client = async_client or redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self.client = client
+        self.async_client = async_client
+        self.local = InProcessBroker(queue_size)
+        self._pubsub = None
+        self._listener = None
+
+    async def subscribe(self, channel):
+        if self._pubsub is None:
+            self._pubsub = self.async_client.pubsub()
+        if not self.local.has_subscribers(channel):
+            await self._pubsub.subscribe(self.prefix + channel)
+        subscription = await self.local.subscribe(channel)
+        subscription.broker = self
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.ensure_future(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.local.unsubscribe(subscription)
+        if not self.local.has_subscribers(subscription.channel) and self._pubsub is not None:
+            try:
+                subscription.loop.create_task(self._pubsub.unsubscribe(self.prefix + subscription.channel))
+            except RuntimeError:
+                pass
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    async def _listen(self):
+        while True:
+            try:
+                event = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception:
+                logger.exception("Redis pub/sub listener failed")
+                await asyncio.sleep(1)
+                continue
+            if event is None:
+                if not self.local._subscribers:
+                    return
+                continue
+            channel = event['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            self.local.publish(channel[len(self.prefix):], json.loads(event['data']))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by ``REALTIME_BROKER``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, 'REALTIME_BROKER', {})
+                backend = import_string(config.get('BACKEND', 'base.broker.InProcessBroker'))
+                _broker = backend(**config.get('OPTIONS', {}))
+    return _broker
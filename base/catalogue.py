@@ -0,0 +1,103 @@
+"""
+Read-through cache of the topic catalogue.
+
+Nearly every page lists topics, and there are few of them, so the whole
+catalogue is kept in two tiers: a copy in this process and a copy in the
+default cache. Both are tagged with the ``topics`` fragment version from
+``base.fragments``, which the signal handlers bump whenever a topic or
+a topic's room count changes. A read costs one cache lookup for the
+version; the database is only queried after an invalidation.
+
+The second tier, and invalidation across workers, need the default cache
+to be shared (``CACHE_URL``). With the in-memory fallback each process
+has its own copy and version, so a bump only reaches the process that
+made it; ``manage.py check --deploy`` warns about that.
+
+Which tier answered each read is counted in ``/metrics/`` as
+``studybuddy_topic_catalogue_reads_total{tier="local|shared|database"}``.
+"""
+
+import bisect
+
+from django.core.cache import cache
+
+from . import fragments, metrics
+from .models import Topic
+
+CACHE_KEY = 'topic-catalogue:{}'
+
+
+class Catalogue:
+    def __init__(self, version, topics):
+        self.version = version
+        self.topics = tuple(topics)
+        self.by_name = {}
+        for topic in self.topics:
+            self.by_name.setdefault(topic.name, topic)
+        # Sorted (lowercase name, position) pairs for prefix lookups.
+        self.sorted_names = sorted((topic.name.lower(), i) for i, topic in enumerate(self.topics))
+
+    def with_prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.sorted_names, (prefix,))
+        positions = []
+        for name, position in self.sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            positions.append(position)
+        return [self.topics[position] for position in sorted(positions)]
+
+
+_local = None
+
+
+def get_catalogue():
+    """The current catalogue, from this process, the shared cache or the database."""
+    global _local
+    version = fragments.version(fragments.TOPICS)
+    local = _local
+    if local is not None and local.version == version:
+        metrics.registry.inc('topic_catalogue_reads_total', 'local')
+        return local
+
+    topics = cache.get(CACHE_KEY.format(version))
+    if topics is not None:
+        metrics.registry.inc('topic_catalogue_reads_total', 'shared')
+    else:
+        metrics.registry.inc('topic_catalogue_reads_total', 'database')
+        # The version was read first, so a concurrent bump can only leave
+        # fresher rows under an already stale version, never the reverse.
+        topics = list(Topic.objects.order_by('pk'))
+        cache.set(CACHE_KEY.format(version), topics, None)
+    _local = Catalogue(version, topics)
+    return _local
+
+
+def all_topics():
+    return list(get_catalogue().topics)
+
+
+def topics_with_prefix(prefix):
+    """Topics whose name starts with ``prefix``, case-insensitively."""
+    if not prefix:
+        return all_topics()
+    return get_catalogue().with_prefix(prefix)
+
+
+def get_or_create_topic(name):
+    """
+    ``Topic.objects.get_or_create(name=name)`` that skips the query when the
+    topic is already in the catalogue. Creating a topic invalidates the
+    catalogue once the transaction commits.
+    """
+    topic = get_catalogue().by_name.get(name)
+    if topic is not None:
+        return topic, False
+    topic, created = Topic.objects.get_or_create(name=name)
+    if created:
+        invalidate()
+    return topic, created
+
+
+def invalidate():
+    fragments.bump(fragments.TOPICS)
@@ -0,0 +1,33 @@
+"""
+System checks for settings a multi-process deployment needs
+(``manage.py check --deploy``).
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose data lives in one process only.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_shared_cache(alias='default'):
+    """True if cache ``alias`` is visible to every worker process."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared_cache():
+        return []
+    return [Warning(
+        "The default cache is local to each process.",
+        hint=(
+            "Login throttling, fragment versions and the topic catalogue are kept "
+            "per process, so with several workers limits multiply and invalidations "
+            "do not reach the other workers. Set CACHE_URL to a Redis server."
+        ),
+        id='base.W001',
+    )]
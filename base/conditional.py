@@ -0,0 +1,86 @@
+"""
+Validators for conditional GETs of a room (``room()`` and the single-room
+API), used with Django's ``condition`` decorator so a matching
+``If-None-Match``/``If-Modified-Since`` gets a 304 before the view queries
+messages, renders a template or serializes anything.
+
+A room's state is read in one query: its own ``updated`` and denormalized
+counters (which change when messages are deleted or participants join)
+plus the newest ``updated`` among its messages.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import fragments
+from .models import Room
+
+
+def room_state(request, pk):
+    """(updated, message_count, participant_count, last_message_update) for room ``pk``, memoized per request."""
+    cache = request.__dict__.setdefault('_room_state', {})
+    if pk not in cache:
+        cache[pk] = (
+            Room.objects.filter(pk=pk)
+            .annotate(last_message=Max('room_messages__updated'))
+            .values_list('updated', 'message_count', 'participant_count', 'last_message')
+            .first()
+        ) if str(pk).isdigit() else None
+    return cache[pk]
+
+
+def _etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def room_last_modified(request, pk):
+    state = room_state(request, pk)
+    if state is None:
+        return None
+    updated, _messages, _participants, last_message = state
+    return max(updated, last_message) if last_message else updated
+
+
+def room_page_etag(request, pk):
+    """
+    ETag of the rendered room page. The page also depends on who is looking
+    (host/author controls, navbar) and on the message window requested, so
+    those are part of the tag, and it shows the names and avatars of the
+    host, authors and participants: the ``users`` fragment version changes
+    whenever any user's profile does. Likewise ``topics`` covers the topic
+    name, and ``archive`` the archived messages a window can reach, which
+    the room state does not track; all three are one cache round trip.
+    The CSRF token is left out; any token for the same cookie is accepted,
+    and logging in changes the user anyway.
+    Pending flash messages disable conditional handling so they are not
+    swallowed by a 304.
+    """
+    state = room_state(request, pk)
+    if state is None or getattr(request, '_messages', None):
+        return None
+    versions = fragments.versions()
+    return _etag(
+        'room-page', *state,
+        versions[fragments.USERS], versions[fragments.TOPICS], versions[fragments.ARCHIVE],
+        request.user.pk,
+        request.GET.urlencode(),
+    )
+
+
+def room_page_last_modified(request, pk):
+    # The page varies per user, so only the ETag can validate it.
+    return None
+
+
+def api_room_etag(request, pk):
+    state = room_state(request, pk)
+    if state is None:
+        return None
+    return _etag('api-room', *state, request.GET.urlencode())
+
+
+def cache_policy(name):
+    """The Cache-Control directives configured for endpoint ``name`` in CACHE_CONTROL_POLICIES."""
+    return settings.CACHE_CONTROL_POLICIES.get(name, {})
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import fragments
+
+
+def fragment_cache(request):
+    """
+    ``fragment_versions`` and ``fragment_ttl`` for the ``{% cache %}`` blocks
+    in the components. Versions are only fetched if a template uses them.
+    """
+    return {
+        'fragment_versions': SimpleLazyObject(fragments.versions),
+        'fragment_ttl': settings.FRAGMENT_CACHE_TTL,
+    }
@@ -0,0 +1,72 @@
+"""
+Denormalized counters: Room.participant_count, Room.message_count and
+Topic.room_count.
+
+They are adjusted with single ``F()`` updates from the signal handlers in
+``base.signals`` so templates can show counts without a COUNT query per
+row. ``reconcile()`` (``manage.py reconcile_counters``) recomputes them
+in bulk if they ever drift.
+"""
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def adjust(model, pk, field, delta, using='default'):
+    """Add ``delta`` to ``field`` of one row without loading it, never going below zero."""
+    if pk is None or not delta:
+        return
+    model.objects.using(using).filter(pk=pk).update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def recount_participants(room_model, room_ids, using='default'):
+    through = room_model.participants.through
+    room_model.objects.using(using).filter(pk__in=room_ids).update(
+        participant_count=_count_of(through.objects.using(using), 'room_id')
+    )
+
+
+def _count_of(queryset, fk):
+    """Correlated ``COUNT(*)`` subquery of ``queryset`` rows whose ``fk`` is the outer row."""
+    counts = (
+        queryset.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def _message_count(message_model, archive_model, using):
+    count = _count_of(message_model.objects.using(using), 'room_id')
+    if archive_model is not None:
+        count = count + _count_of(archive_model.objects.using(using), 'room_id')
+    return count
+
+
+def reconcile(room_model, topic_model, message_model, using='default', archive_model=None):
+    """
+    Recompute every counter from the source tables, touching only rows
+    that have drifted. Takes the models as arguments so migrations can pass
+    historical models. Room.message_count includes ``archive_model`` rows
+    if given. Returns the number of (rooms, topics) fixed.
+    """
+    through = room_model.participants.through
+    rooms = room_model.objects.using(using).alias(
+        actual_participants=_count_of(through.objects.using(using), 'room_id'),
+        actual_messages=_message_count(message_model, archive_model, using),
+    ).exclude(
+        participant_count=F('actual_participants'),
+        message_count=F('actual_messages'),
+    )
+    fixed_rooms = rooms.update(
+        participant_count=_count_of(through.objects.using(using), 'room_id'),
+        message_count=_message_count(message_model, archive_model, using),
+    )
+
+    topics = topic_model.objects.using(using).alias(
+        actual_rooms=_count_of(room_model.objects.using(using), 'topic_id'),
+    ).exclude(room_count=F('actual_rooms'))
+    fixed_topics = topics.update(room_count=_count_of(room_model.objects.using(using), 'topic_id'))
+    return fixed_rooms, fixed_topics
@@ -1,6 +1,7 @@
 from django.forms import ModelForm
 from .models import Room,User
 from django.contrib.auth.forms import UserCreationForm
+from . import hashing
 
 class RoomForm(ModelForm):
     class Meta:
@@ -19,3 +20,12 @@ class MyUserCreationForm(UserCreationForm):
     class Meta:
         model = User
         fields =['first_name','last_name', "username","email","password1","password2"]
+
+    def save(self, commit=True):
+        # UserCreationForm.save, with the password hashed in base.hashing's pool.
+        user = ModelForm.save(self, commit=False)
+        user.password = hashing.make_password(self.cleaned_data["password1"])
+        if commit:
+            user.save()
+            self.save_m2m()
+        return user
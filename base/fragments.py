@@ -0,0 +1,64 @@
+"""
+Version counters for cached template fragments.
+
+The topic, feed and activity components are wrapped in ``{% cache %}``
+blocks whose keys include the version of every kind of data they show.
+Signal handlers bump a version when matching rows change, so stale
+fragments are simply never looked up again and expire on their own.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+TOPICS = 'topics'
+ROOMS = 'rooms'
+MESSAGES = 'messages'
+USERS = 'users'
+# Archived messages: deleted, hidden by moderation or newly moved there. Room
+# pages read it, since their first window can run into the archive.
+ARCHIVE = 'archive'
+NAMES = (TOPICS, ROOMS, MESSAGES, USERS, ARCHIVE)
+
+
+def _key(name):
+    return f'fragment-version:{name}'
+
+
+def bump(*names, using='default'):
+    """
+    Invalidate fragments showing ``names``. Deferred until the surrounding
+    transaction commits, so a fragment rendered from the old rows cannot be
+    stored under the new version.
+    """
+    transaction.on_commit(lambda: _bump(names), using=using)
+
+
+def _bump(names):
+    for name in names:
+        try:
+            cache.incr(_key(name))
+        except ValueError:
+            # Missing (never set or evicted): start from a fresh, unique value.
+            cache.set(_key(name), time.time_ns(), None)
+
+
+def version(name):
+    """Current version of one fragment dependency."""
+    value = cache.get(_key(name))
+    if value is None:
+        value = time.time_ns()
+        if not cache.add(_key(name), value, None):
+            value = cache.get(_key(name), value)
+    return value
+
+
+def versions():
+    """Current version of every fragment dependency, in one cache round trip."""
+    found = cache.get_many([_key(name) for name in NAMES])
+    missing = {_key(name): time.time_ns() for name in NAMES if _key(name) not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {name: found[_key(name)] for name in NAMES}
@@ -0,0 +1,133 @@
+"""
+Password hashing off the request workers.
+
+PBKDF2 takes tens of milliseconds of CPU per call. Login and registration
+hand it to a small process pool so a burst of credential checks uses at
+most ``PASSWORD_HASH_WORKERS`` cores and leaves the request threads
+free to render pages. At most ``PASSWORD_HASH_QUEUE`` more calls
+wait for a worker; past that, a caller waits up to
+``PASSWORD_HASH_TIMEOUT`` seconds for a place in the queue and then gets
+``HashingBusy``. Attempts are also throttled per email and per client IP
+before any hashing is queued. The attempt counters live in the default
+cache, so the limits hold across worker processes only when it is shared
+(``CACHE_URL``, see ``base.checks``).
+"""
+
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import cache
+
+
+class HashingBusy(Exception):
+    """Every worker is busy and the queue is full."""
+
+
+class Throttled(Exception):
+    """Too many recent attempts for this email or client IP."""
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def get_executor():
+    """The shared pool, or None to hash inline when PASSWORD_HASH_WORKERS is 0."""
+    global _executor, _slots
+    workers = getattr(settings, 'PASSWORD_HASH_WORKERS', 2)
+    if not workers:
+        return None
+    with _lock:
+        if _executor is None:
+            # spawn: forking a process that already runs threads and holds
+            # database connections is not safe.
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            _slots = threading.BoundedSemaphore(workers + getattr(settings, 'PASSWORD_HASH_QUEUE', 16))
+        return _executor
+
+
+def _run(fn, *args):
+    global _executor
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(timeout=getattr(settings, 'PASSWORD_HASH_TIMEOUT', 5)):
+        raise HashingBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _future: slots.release())
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool on the next call.
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        raise
+
+
+def check_password(password, encoded):
+    """Return (is_correct, must_update) for ``password`` against the stored hash."""
+    return _run(hashers.verify_password, password, encoded)
+
+
+def make_password(password):
+    return _run(hashers.make_password, password)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '') if request is not None else ''
+
+
+def _throttle_keys(request, email):
+    yield 'email', hashlib.md5((email or '').lower().encode()).hexdigest()
+    yield 'ip', client_ip(request)
+
+
+def throttle(request, email):
+    """
+    Count a credential attempt for ``email`` and the client's IP, raising
+    Throttled once either is over its AUTH_THROTTLE (attempts, seconds) limit.
+    Counting is one atomic INCR on Redis, so concurrent workers cannot both
+    get the last attempt.
+    """
+    limits = getattr(settings, 'AUTH_THROTTLE', {})
+    for scope, value in _throttle_keys(request, email):
+        if scope not in limits:
+            continue
+        attempts, window = limits[scope]
+        key = f'auth-throttle:{scope}:{value}'
+        cache.add(key, 0, window)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, window)
+            count = 1
+        if count > attempts:
+            raise Throttled()
+
+
+def reset_throttle(request, email):
+    """Forget the attempts for ``email`` after a successful login; the IP count stays."""
+    for scope, value in _throttle_keys(request, email):
+        if scope == 'email':
+            cache.delete(f'auth-throttle:{scope}:{value}')
@@ -0,0 +1,247 @@
+"""
+Streaming bulk import of ``dumpdata``-style JSON (e.g. new_datadump.json).
+
+``loaddata`` parses the whole file and saves objects one at a time with
+signals firing. Here the file is read incrementally and imported in two
+passes with memory bounded by the batch size:
+
+1. Stream the array, convert each User/Topic/Room/Message object into a
+   row for the current schema and spool it to a per-model temporary file.
+   Room participants become rows of their own.
+2. Load the spools in dependency order (users, topics, rooms, participants,
+   messages) with ``bulk_create``, each batch in its own transaction and,
+   optionally, several batches of the same model in parallel.
+
+bulk_create skips signals, so the denormalized counters and the search
+index are rebuilt once at the end instead of once per row.
+
+Dumps from before the custom user model (``auth.user`` with integer ids,
+``update`` instead of ``updated``) are mapped onto the current schema.
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.color import no_style
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from . import counters, fragments, search
+from .models import ArchivedMessage, Message, Room, Topic, User
+
+PARTICIPANTS = 'base.room_participants'
+MODELS = {
+    'base.user': User,
+    'base.topic': Topic,
+    'base.room': Room,
+    PARTICIPANTS: Room.participants.through,
+    'base.message': Message,
+    'base.archivedmessage': ArchivedMessage,
+}
+# Insert order: every model after the ones it references.
+ORDER = tuple(MODELS)
+LEGACY_MODELS = {'auth.user': 'base.user'}
+FIELD_ALIASES = {'update': 'updated'}
+LEGACY_USER_NAMESPACE = uuid.UUID('5b1c36e2-7a0e-4a5e-9a52-5f0c3c1d8a10')
+
+
+def iter_objects(fp, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON array one at a time, reading ``fp`` in chunks."""
+    decoder = json.JSONDecoder()
+    buffer, pos, opened = '', 0, False
+    while True:
+        while pos < len(buffer) and (buffer[pos] in ' \t\r\n,' or (buffer[pos] == '[' and not opened)):
+            opened = opened or buffer[pos] == '['
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = fp.read(chunk_size), 0
+            if not buffer:
+                return
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            error = None
+        except json.JSONDecodeError as exc:
+            item, end, error = None, len(buffer), exc
+        if end == len(buffer) or buffer[end] not in ' \t\r\n,]':
+            # The item continues past the end of the buffer, or is a number
+            # cut short by it (``1`` of ``1.5``): read more before deciding.
+            chunk = fp.read(chunk_size)
+            if chunk:
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if error:
+                raise error
+        yield item
+        pos = end
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def user_pk(value):
+    """A user id from the dump: a UUID, or a legacy auth.user integer mapped to a stable UUID."""
+    if isinstance(value, int) or str(value).isdigit():
+        return str(uuid.uuid5(LEGACY_USER_NAMESPACE, str(value)))
+    return str(value)
+
+
+def _to_rows(label, obj):
+    """The spool rows (label, row) for one dump object in the current schema."""
+    model = MODELS[label]
+    fields = {FIELD_ALIASES.get(name, name): value for name, value in obj['fields'].items()}
+    row = {'id': user_pk(obj['pk']) if model is User else obj['pk']}
+    extra = []
+    for name, value in fields.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue  # Columns that no longer exist.
+        if field.many_to_many:
+            if model is Room and name == 'participants':
+                extra.extend((PARTICIPANTS, {'room_id': obj['pk'], 'user_id': user_pk(pk)}) for pk in value)
+            continue
+        if field.many_to_one:
+            if value is not None and field.related_model is User:
+                value = user_pk(value)
+            row[field.attname] = value
+        else:
+            row[name] = value
+    if model is User and not row.get('email'):
+        # The old user model allowed blank emails; the current one needs unique ones.
+        row['email'] = f"{row['id']}@import.invalid"
+    return [(label, row)] + extra
+
+
+def spool(path, directory):
+    """Pass 1: split the dump into per-model JSON lines files. Returns (counts, skipped)."""
+    files, counts, skipped = {}, {}, {}
+    try:
+        with open(path, encoding='utf-8-sig') as fp:
+            for obj in iter_objects(fp):
+                label = LEGACY_MODELS.get(obj.get('model'), obj.get('model'))
+                if label not in MODELS:
+                    skipped[obj.get('model')] = skipped.get(obj.get('model'), 0) + 1
+                    continue
+                for row_label, row in _to_rows(label, obj):
+                    if row_label not in files:
+                        files[row_label] = open(os.path.join(directory, f'{row_label}.jsonl'), 'w')
+                    files[row_label].write(json.dumps(row) + '\n')
+                    counts[row_label] = counts.get(row_label, 0) + 1
+    finally:
+        for spool_file in files.values():
+            spool_file.close()
+    return counts, skipped
+
+
+def _batches(path, batch_size):
+    batch = []
+    with open(path) as fp:
+        for line in fp:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _instance(model, row):
+    values = {}
+    for name, value in row.items():
+        field = model._meta.get_field(name[:-3] if name.endswith('_id') and name != 'id' else name)
+        if not field.many_to_one and value is not None:
+            value = field.to_python(value)
+        values[name] = value
+    for field in model._meta.concrete_fields:
+        # Timestamps keep their dumped values (see keep_timestamps); fill in missing ones.
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            values.setdefault(field.attname, values.get('created') or timezone.now())
+    return model(**values)
+
+
+@contextmanager
+def keep_timestamps(models=tuple(MODELS.values())):
+    """Stop auto_now/auto_now_add from overwriting the timestamps being inserted."""
+    changed = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            for flag in ('auto_now', 'auto_now_add'):
+                if getattr(field, flag, False):
+                    setattr(field, flag, False)
+                    changed.append((field, flag))
+    try:
+        yield
+    finally:
+        for field, flag in changed:
+            setattr(field, flag, True)
+
+
+def _insert(model, rows, using, ignore_conflicts):
+    close_old_connections()
+    try:
+        with transaction.atomic(using=using):
+            model.objects.using(using).bulk_create(
+                [_instance(model, row) for row in rows], ignore_conflicts=ignore_conflicts,
+            )
+        return len(rows)
+    finally:
+        close_old_connections()
+
+
+def reset_sequences(models, using='default'):
+    """Move id sequences past rows inserted with explicit ids (a no-op on SQLite)."""
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def load(path, batch_size=1000, workers=1, using='default', ignore_conflicts=False, report=None):
+    """
+    Import the dump at ``path``. ``report(label, rows, seconds)`` is called
+    after each model. Returns the counts of objects skipped per dump model.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.monotonic()
+        counts, skipped = spool(path, directory)
+        if report:
+            report('spool', sum(counts.values()), time.monotonic() - started)
+
+        with keep_timestamps(), ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for label in ORDER:
+                if label not in counts:
+                    continue
+                model, started, loaded, pending = MODELS[label], time.monotonic(), 0, set()
+                for rows in _batches(os.path.join(directory, f'{label}.jsonl'), batch_size):
+                    if workers <= 1:
+                        loaded += _insert(model, rows, using, ignore_conflicts)
+                        continue
+                    # Keep only a couple of batches per worker in memory.
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        loaded += sum(future.result() for future in done)
+                    pending.add(executor.submit(_insert, model, rows, using, ignore_conflicts))
+                # A model's rows must all be in before the models that reference it.
+                loaded += sum(future.result() for future in wait(pending).done)
+                if report:
+                    report(label, loaded, time.monotonic() - started)
+
+    started = time.monotonic()
+    reset_sequences(MODELS.values(), using)
+    with transaction.atomic(using=using):
+        counters.reconcile(Room, Topic, Message, using=using, archive_model=ArchivedMessage)
+    search.rebuild(Room, Message, using=using, batch_size=batch_size)
+    fragments.bump(*fragments.NAMES, using=using)
+    if report:
+        report('counters and search index', None, time.monotonic() - started)
+    return skipped
@@ -0,0 +1,196 @@
+"""
+Closed-loop load harness for a running server.
+
+Each worker logs in as one of the synthetic accounts (``base.synthetic``)
+and then replays a weighted mix of page views and API calls until the
+duration is up, picking rooms with the same Zipf skew the data was built
+with. Latencies are recorded per scenario and reported as p50/p95/p99 with
+overall throughput. With the same seed, dataset and settings, two runs send
+the same request mix, so releases can be compared.
+"""
+
+import itertools
+import random
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+
+from . import synthetic
+from .models import Room, User
+
+# Scenario name: relative weight.
+DEFAULT_MIX = {
+    'index': 30,
+    'room': 25,
+    'room_post': 5,
+    'user_profile': 10,
+    'activity_page': 10,
+    'api_rooms': 10,
+    'api_room': 10,
+}
+PERCENTILES = (50, 95, 99)
+
+
+class Targets:
+    """The ids requests are sent to, busiest rooms first."""
+
+    def __init__(self, room_ids, user_ids, emails):
+        self.room_ids = room_ids
+        self.user_ids = user_ids
+        self.emails = emails
+
+    @classmethod
+    def from_database(cls, limit=1000, using='default'):
+        rooms = Room.objects.using(using).order_by('-message_count', 'pk').values_list('pk', flat=True)
+        users = User.objects.using(using).order_by('pk').values_list('pk', flat=True)
+        emails = (
+            User.objects.using(using)
+            .filter(email__endswith='@' + synthetic.EMAIL_DOMAIN)
+            .order_by('email').values_list('email', flat=True)
+        )
+        return cls(list(rooms[:limit]), [str(pk) for pk in users[:limit]], list(emails[:limit]))
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        """A JSON-serializable report; latencies are in milliseconds."""
+        scenarios = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            scenarios[name] = {
+                'requests': len(values),
+                'errors': self.errors.get(name, 0),
+                'rps': len(values) / elapsed if elapsed else 0,
+                **{f'p{p}': percentile(values, p) * 1000 for p in PERCENTILES},
+            }
+        total = sorted(itertools.chain.from_iterable(self.latencies.values()))
+        return {
+            'elapsed': elapsed,
+            'requests': len(total),
+            'errors': sum(self.errors.values()),
+            'rps': len(total) / elapsed if elapsed else 0,
+            **{f'p{p}': (percentile(total, p) or 0) * 1000 for p in PERCENTILES},
+            'scenarios': scenarios,
+        }
+
+
+class Worker:
+    def __init__(self, base_url, targets, rng, password, exponent, timeout):
+        self.base_url = base_url
+        self.targets = targets
+        self.rng = rng
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.logged_in = False
+        self.pick_room = synthetic.ZipfChooser(targets.room_ids, exponent, rng) if targets.room_ids else None
+        self.pick_user = synthetic.ZipfChooser(targets.user_ids, exponent, rng) if targets.user_ids else None
+
+    def url(self, path):
+        return urljoin(self.base_url, path)
+
+    def csrf_post(self, path, data):
+        data = {**data, 'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', '')}
+        return self.session.post(
+            self.url(path), data, headers={'Referer': self.url(path)},
+            allow_redirects=False, timeout=self.timeout,
+        )
+
+    def login(self, email):
+        self.session.get(self.url('/login/'), timeout=self.timeout)
+        response = self.csrf_post('/login/', {'email': email, 'password': self.password})
+        self.logged_in = response.status_code == 302
+        return self.logged_in
+
+    def request(self, name):
+        """Send one request for scenario ``name``; True if it succeeded, None if it was not sent."""
+        if name == 'index':
+            response = self.session.get(self.url('/'), timeout=self.timeout)
+        elif name == 'room':
+            response = self.session.get(self.url(f'/room/{self.pick_room()}/'), timeout=self.timeout)
+        elif name == 'room_post':
+            if not self.logged_in:
+                return None
+            body = ' '.join(self.rng.choices(synthetic.WORDS, k=self.rng.randint(3, 20)))
+            response = self.csrf_post(f'/room/{self.pick_room()}/', {'message_body': body})
+        elif name == 'user_profile':
+            response = self.session.get(self.url(f'/user-profile/{self.pick_user()}/'), timeout=self.timeout)
+        elif name == 'activity_page':
+            response = self.session.get(self.url('/activityPage/'), timeout=self.timeout)
+        elif name == 'api_rooms':
+            response = self.session.get(self.url('/api/rooms/'), timeout=self.timeout)
+        elif name == 'api_room':
+            response = self.session.get(self.url(f'/api/room/{self.pick_room()}/'), timeout=self.timeout)
+        else:
+            raise ValueError(f"Unknown scenario {name!r}")
+        return response.status_code < 400
+
+
+def run(base_url, targets, duration=30, concurrency=8, mix=None, seed=0, warmup=5,
+        password=synthetic.DEFAULT_PASSWORD, exponent=1.1, timeout=10):
+    """
+    Run the load test for ``warmup`` + ``duration`` seconds with
+    ``concurrency`` workers and return the summary of the measured part.
+    """
+    missing = set()
+    if not targets.room_ids:
+        missing |= {'room', 'room_post', 'api_room'}
+    if not targets.user_ids:
+        missing.add('user_profile')
+    mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight > 0 and name not in missing}
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    workers = [
+        Worker(base_url, targets, random.Random(seed * 1000 + i), password, exponent, timeout)
+        for i in range(concurrency)
+    ]
+    for i, worker in enumerate(workers):
+        if targets.emails:
+            worker.login(targets.emails[i % len(targets.emails)])
+
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    def loop(worker):
+        while (now := time.monotonic()) < deadline:
+            name = worker.rng.choices(names, weights)[0]
+            try:
+                ok = worker.request(name)
+            except requests.RequestException:
+                ok = False
+            if ok is not None and now >= measure_from:
+                recorder.record(name, time.monotonic() - now, ok)
+
+    threads = [threading.Thread(target=loop, args=(worker,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = recorder.summary(time.monotonic() - measure_from)
+    summary.update(
+        base_url=base_url, concurrency=concurrency, seed=seed,
+        logged_in=sum(worker.logged_in for worker in workers),
+    )
+    return summary
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from base import archive
+
+
+class Command(BaseCommand):
+    help = "Move messages older than MESSAGE_ARCHIVE_AFTER_DAYS into the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive messages older than this many days instead.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        moved = archive.archive(
+            before=archive.cutoff(options['days']),
+            batch_size=options['batch_size'],
+            using=options['database'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} messages."))
@@ -0,0 +1,70 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every view against the current dataset, check its query, time and memory budgets "
+        "and diff the results against the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Timed requests per view.")
+        parser.add_argument('--only', nargs='*', default=[], help="Benchmark only these views.")
+        parser.add_argument('--baseline', default=str(settings.BENCHMARK_BASELINE))
+        parser.add_argument('--output', help="Write the report to this file.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store this run as the new baseline instead of comparing.")
+
+    def handle(self, *args, **options):
+        cases = benchmarks.CASES
+        if options['only']:
+            unknown = set(options['only']) - {case.name for case in cases}
+            if unknown:
+                raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}.")
+            cases = [case for case in cases if case.name in options['only']]
+
+        report = benchmarks.run(cases, repeat=options['repeat'])
+
+        self.stdout.write(f"{'view':<22}{'status':>7}{'queries':>9}{'ms':>10}{'kb':>10}")
+        for name, row in report['views'].items():
+            self.stdout.write(
+                f"{name:<22}{row['status']:>7}{row['queries']:>9}{row['ms']:>10.1f}{row['kb']:>10.1f}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(report, fp, indent=2)
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as fp:
+                json.dump(report, fp, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Stored the baseline in {options['baseline']}."))
+            return
+
+        failures = [
+            f"{name}: {metric} {value} over budget {budget}"
+            for name, metric, value, budget in benchmarks.over_budget(report)
+        ]
+        failures += [f"{name}: {status} response" for name, row in report['views'].items()
+                     if (status := row["status"]) >= 400]
+        try:
+            with open(options['baseline']) as fp:
+                baseline = json.load(fp)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(f"No baseline at {options['baseline']}; use --update-baseline."))
+        else:
+            if baseline.get('dataset') != report['dataset']:
+                self.stdout.write(self.style.WARNING("The baseline was taken on a different dataset."))
+            for name, metric, before, after in benchmarks.compare(report, baseline):
+                self.stdout.write(f"{name} {metric}: {before} -> {after}")
+            failures += [
+                f"{name}: {after} queries, {before} in the baseline"
+                for name, _metric, before, after in benchmarks.query_regressions(report, baseline)
+            ]
+
+        if failures:
+            raise CommandError("Benchmarks failed:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All views are within budget."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from base import avatars
+from base.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate avatar thumbnails for users whose avatar has none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate thumbnails for every avatar.")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['all']:
+            users = users.filter(avatar_hash='')
+        jobs = [
+            avatars.get_executor().submit(avatars.process_avatar, user_id, name)
+            for user_id, name in users.values_list('pk', 'avatar').iterator()
+        ]
+        done = sum(1 for job in jobs if job.result())
+        self.stdout.write(self.style.SUCCESS(f"Built thumbnails for {done} of {len(jobs)} avatars."))
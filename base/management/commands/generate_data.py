@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from base import synthetic
+
+
+class Command(BaseCommand):
+    help = "Add a synthetic dataset with Zipf-skewed room activity, e.g. for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--messages', type=int, default=100_000)
+        parser.add_argument('--topics', type=int, default=100)
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help="Zipf exponent; higher means busier hot rooms and users.")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Spread timestamps over this many days before now.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default=synthetic.DEFAULT_PASSWORD)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-index', action='store_true',
+                            help="Skip rebuilding the search index afterwards.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        synthetic.generate(
+            users=options['users'],
+            rooms=options['rooms'],
+            messages=options['messages'],
+            topics=options['topics'],
+            exponent=options['exponent'],
+            days=options['days'],
+            seed=options['seed'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            using=options['database'],
+            index=not options['no_index'],
+            report=self.report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated dataset {options['seed']}; log in as user0.{options['seed']:x}@{synthetic.EMAIL_DOMAIN}."
+        ))
+
+    def report(self, label, rows, seconds):
+        if rows is None:
+            self.stdout.write(f"{label}: {seconds:.2f}s")
+            return
+        rate = rows / seconds if seconds else float('inf')
+        self.stdout.write(f"{label}: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
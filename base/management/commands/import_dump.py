@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from base import loader
+
+
+class Command(BaseCommand):
+    help = "Stream a dumpdata JSON file (e.g. new_datadump.json) into the database with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Insert batches of the same model in parallel (useful on Postgres).")
+        parser.add_argument('--ignore-conflicts', action='store_true',
+                            help="Skip rows that already exist instead of failing.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        skipped = loader.load(
+            options['path'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            using=options['database'],
+            ignore_conflicts=options['ignore_conflicts'],
+            report=self.report,
+        )
+        for model, count in sorted(skipped.items()):
+            self.stdout.write(f"Skipped {count} {model} objects (not imported by this command).")
+        self.stdout.write(self.style.SUCCESS("Import finished."))
+
+    def report(self, label, rows, seconds):
+        if rows is None:
+            self.stdout.write(f"{label}: {seconds:.2f}s")
+            return
+        rate = rows / seconds if seconds else float('inf')
+        self.stdout.write(f"{label}: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
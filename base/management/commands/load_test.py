@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import loadtest
+
+
+class Command(BaseCommand):
+    help = "Replay a weighted request mix against a running server and report latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--warmup', type=float, default=5)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--mix', default='',
+                            help="Scenario weights, e.g. 'index=50,room=50'. "
+                                 f"Scenarios: {', '.join(loadtest.DEFAULT_MIX)}.")
+        parser.add_argument('--password', default=loadtest.synthetic.DEFAULT_PASSWORD)
+        parser.add_argument('--targets', type=int, default=1000,
+                            help="Number of the busiest rooms (and of users) to send requests to.")
+        parser.add_argument('--json', dest='json_path', help="Also write the report to this file.")
+        parser.add_argument('--database', default='default',
+                            help="Database to read room and user ids from.")
+
+    def handle(self, *args, **options):
+        mix = dict(loadtest.DEFAULT_MIX)
+        if options['mix']:
+            mix = {}
+            for item in options['mix'].split(','):
+                name, _sep, weight = item.partition('=')
+                if name.strip() not in loadtest.DEFAULT_MIX or not weight.strip().isdigit():
+                    raise CommandError(f"Invalid mix entry {item!r}.")
+                mix[name.strip()] = int(weight)
+
+        targets = loadtest.Targets.from_database(options['targets'], using=options['database'])
+        summary = loadtest.run(
+            options['url'],
+            targets,
+            duration=options['duration'],
+            concurrency=options['concurrency'],
+            mix=mix,
+            seed=options['seed'],
+            warmup=options['warmup'],
+            password=options['password'],
+        )
+
+        self.stdout.write(f"{'scenario':<16}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = list(summary['scenarios'].items()) + [('total', summary)]
+        for name, row in rows:
+            self.stdout.write(
+                f"{name:<16}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9.1f}"
+                f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}"
+            )
+        self.stdout.write(f"{summary['logged_in']}/{summary['concurrency']} workers logged in.")
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fp:
+                json.dump(summary, fp, indent=2)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from base import archive
+
+
+class Command(BaseCommand):
+    help = "Report the size of the hot and archived message partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        for size in archive.partition_sizes(using=options['database']):
+            on_disk = f"{size['bytes'] / 1024:.0f} KiB" if size['bytes'] is not None else "unknown size"
+            span = f"{size['oldest']:%Y-%m-%d} to {size['newest']:%Y-%m-%d}" if size['rows'] else "empty"
+            self.stdout.write(f"{size['partition']:8} {size['table']:26} {size['rows']:>10} rows  {on_disk:>12}  {span}")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base.moderation import ModerationPool
+
+
+class Command(BaseCommand):
+    help = "Run the background moderation worker pool over pending messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'MODERATION_WORKERS', 2))
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'MODERATION_BATCH_SIZE', 500))
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when there is nothing to moderate.")
+        parser.add_argument('--once', action='store_true', help="Drain the current backlog and exit.")
+
+    def handle(self, *args, **options):
+        pool = ModerationPool(workers=options['workers'], batch_size=options['batch_size'])
+        try:
+            if options['once']:
+                while pool.run_round():
+                    pass
+            else:
+                pool.run(interval=options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.stop()
+        self.stdout.write(self.style.SUCCESS(
+            f"Moderated {pool.processed} messages, {pool.offending} flagged or hidden."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions from the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = SessionStore.clear_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from base import search
+from base.models import Message, Room
+
+
+class Command(BaseCommand):
+    help = "Rebuild the room and message full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if search.get_backend(connections[using]) is None:
+            raise CommandError(f"No search backend for the '{connections[using].vendor}' database.")
+
+        with transaction.atomic(using=using):
+            rooms, messages = search.rebuild(Room, Message, using=using, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rooms} rooms and {messages} messages."))
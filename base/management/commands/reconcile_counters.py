@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base import counters
+from base.models import ArchivedMessage, Message, Room, Topic
+
+
+class Command(BaseCommand):
+    help = "Recompute room participant/message counts and topic room counts, fixing any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            rooms, topics = counters.reconcile(
+                Room, Topic, Message, using=options['database'], archive_model=ArchivedMessage,
+            )
+        self.stdout.write(self.style.SUCCESS(f"Fixed counters on {rooms} rooms and {topics} topics."))
@@ -0,0 +1,125 @@
+"""
+Posting messages, shared by the room view and the WebSocket endpoint, and
+the small JSON frames pushed to subscribers of a room.
+"""
+
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import counters, fragments, search
+from .avatars import avatar_for
+from .broker import get_broker
+from .models import Message, Room
+from .pagination import encode_cursor
+from .sqlite import WriteQueue
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def room_channel(room_id):
+    return f'room.{room_id}'
+
+
+def post_message(user, room, body):
+    """
+    Store a message in ``room`` and make ``user`` a participant. With the
+    SQLite write queue on, raises ``base.sqlite.WriteTimeout`` if the
+    message could not be written in time; it is then not stored at all.
+    """
+    if not body or not body.strip():
+        # Checked here as well as by callers: an empty body would fail a whole queued batch.
+        raise ValueError("A message needs a body.")
+    write_queue = get_write_queue()
+    if write_queue is None or connections['default'].in_atomic_block:
+        message = Message.objects.create(user=user, room=room, body=body)
+        room.participants.add(user)
+        return message
+    return write_queue.submit((user, room, body))
+
+
+def _commit_posts(pairs):
+    with transaction.atomic():
+        return post_messages(pairs)
+
+
+def get_write_queue():
+    """
+    The process's single message writer when SQLITE_WRITE_QUEUE is on and
+    the database is SQLite, else None (write from the calling thread).
+    """
+    global _write_queue
+    if not getattr(settings, 'SQLITE_WRITE_QUEUE', False) or connections['default'].vendor != 'sqlite':
+        return None
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue(
+                _commit_posts,
+                batch_size=getattr(settings, 'SQLITE_WRITE_BATCH_SIZE', 100),
+                timeout=getattr(settings, 'SQLITE_WRITE_TIMEOUT', 10),
+            )
+        return _write_queue
+
+
+def post_messages(pairs, using='default'):
+    """
+    Store many messages at once. ``pairs`` is a list of (user, room, body).
+    One bulk INSERT for the messages and one for new participants; since
+    bulk_create skips model signals, the work the signal handlers do for a
+    single message (counters, search index, live delivery) is done here in
+    bulk. Call inside a transaction. Returns the created messages.
+    """
+    messages = Message.objects.using(using).bulk_create(
+        [Message(user=user, room=room, body=body) for user, room, body in pairs]
+    )
+    through = Room.participants.through
+    memberships = {(room.pk, user.pk) for user, room, _body in pairs}
+    through.objects.using(using).bulk_create(
+        [through(room_id=room_id, user_id=user_id) for room_id, user_id in memberships],
+        ignore_conflicts=True,
+    )
+
+    counters.recount_participants(Room, {room_id for room_id, _user_id in memberships}, using)
+    for room_id, count in Counter(message.room_id for message in messages).items():
+        counters.adjust(Room, room_id, 'message_count', count, using)
+    search.index_messages(messages, using=using)
+    fragments.bump(fragments.MESSAGES, fragments.ROOMS, using=using)
+
+    payloads = [(message.room_id, message_payload(message)) for message in messages]
+
+    def publish():
+        broker = get_broker()
+        for room_id, payload in payloads:
+            broker.publish(room_channel(room_id), payload)
+    transaction.on_commit(publish, using=using)
+    return messages
+
+
+def message_cursor(message):
+    """The ``?after=`` cursor for the messages posted after ``message``."""
+    return encode_cursor([message.created.isoformat(), message.pk], 'next')
+
+
+def message_payload(message):
+    user = message.user
+    return {
+        'type': 'message',
+        'id': message.pk,
+        'room': message.room_id,
+        'body': message.body,
+        'created': message.created.isoformat(),
+        # Where a client that has seen this message resumes after a reconnect.
+        'cursor': message_cursor(message),
+        'user': {
+            'id': str(user.pk),
+            'username': user.username,
+            'avatar': avatar_for(user, 'small'),
+        },
+    }
+
+
+def deleted_payload(message):
+    return {'type': 'message.deleted', 'id': message.pk, 'room': message.room_id}
@@ -0,0 +1,303 @@
+"""
+Request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records, per URL name: request latency, SQL query
+count and time, template render time and response size, all as
+histograms, plus a request counter by status. Queries are timed by an
+execute wrapper added to every connection, templates by the
+``TimedDjangoTemplates`` backend. Recording is a few additions under a
+lock, cheap enough to leave on under full load. Other modules count
+their own events with ``registry.inc()``, such as the topic catalogue's
+hits and misses per cache tier.
+
+Each process keeps its own totals in memory. With ``METRICS_DIR`` set,
+every process also writes them to its own file there at most every
+``METRICS_FLUSH_INTERVAL`` seconds (atomically, by renaming a temporary
+file), and the endpoint sums all the files, so the numbers cover every
+worker whichever one is scraped. Empty the directory on deploy, as with
+prometheus_client's multiprocess mode.
+"""
+
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+PREFIX = 'studybuddy_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# name: (type, help, label names, buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests by view, method and status code.', ('view', 'method', 'status'), None),
+    'http_request_duration_seconds': (
+        'histogram', 'Time until the response is returned (first byte for streams).',
+        ('view', 'method'), LATENCY_BUCKETS),
+    'http_response_size_bytes': (
+        'histogram', 'Response body size; streamed responses are not included.', ('view',), SIZE_BUCKETS),
+    'http_request_db_queries': (
+        'histogram', 'SQL queries per request.', ('view',), QUERY_BUCKETS),
+    'http_request_db_seconds': (
+        'histogram', 'Time spent in SQL queries per request.', ('view',), LATENCY_BUCKETS),
+    'http_request_template_seconds': (
+        'histogram', 'Time spent rendering templates per request.', ('view',), LATENCY_BUCKETS),
+    'topic_catalogue_reads_total': (
+        'counter', 'Topic catalogue reads by the tier that answered (base.catalogue).', ('tier',), None),
+}
+
+
+class RequestSample:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+class Registry:
+    """
+    This process's totals. Counters are ``{labels: value}``; histograms are
+    ``{labels: [count per bucket..., count above the last bucket, sum]}``,
+    with labels as a JSON list so snapshots can be written out as is.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {name: {} for name in METRICS}
+        self.path = None
+        self.flushed = 0.0
+
+    def _inc(self, name, key, amount=1):
+        series = self.values[name]
+        series[key] = series.get(key, 0) + amount
+
+    def _observe(self, name, key, value):
+        row = self.values[name].get(key)
+        if row is None:
+            row = self.values[name][key] = [0] * (len(METRICS[name][3]) + 2)
+        row[bisect.bisect_left(METRICS[name][3], value)] += 1
+        row[-1] += value
+
+    def inc(self, name, *labels):
+        """Add one to the counter ``name`` for ``labels``."""
+        key = json.dumps(list(labels))
+        with self.lock:
+            self._inc(name, key)
+
+    def record_request(self, view, method, status, seconds, size, sample):
+        """Add one request's measurements; one lock round trip per request."""
+        view_key = json.dumps([view])
+        method_key = json.dumps([view, method])
+        with self.lock:
+            self._inc('http_requests_total', json.dumps([view, method, str(status)]))
+            self._observe('http_request_duration_seconds', method_key, seconds)
+            if size is not None:
+                self._observe('http_response_size_bytes', view_key, size)
+            self._observe('http_request_db_queries', view_key, sample.queries)
+            self._observe('http_request_db_seconds', view_key, sample.db_seconds)
+            self._observe('http_request_template_seconds', view_key, sample.template_seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {key: list(row) if isinstance(row, list) else row for key, row in series.items()}
+                for name, series in self.values.items()
+            }
+
+    def flush(self, force=False):
+        """Write this process's totals to its file in METRICS_DIR, if set and due."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)):
+            return
+        self.flushed = now
+        if self.path is None:
+            if not any(self.values.values()):
+                return  # Nothing recorded (e.g. a management command).
+            # The random part keeps a recycled pid from overwriting a dead process's totals.
+            self.path = os.path.join(directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(self.snapshot(), fp)
+        os.replace(temp_path, self.path)
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+
+def merge(snapshots):
+    """Sum counters and histogram rows across snapshots."""
+    total = {name: {} for name in METRICS}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in total:
+                continue
+            target = total[name]
+            for key, row in series.items():
+                if isinstance(row, list):
+                    current = target.get(key)
+                    target[key] = row if current is None else [a + b for a, b in zip(current, row)]
+                else:
+                    target[key] = target.get(key, 0) + row
+    return total
+
+
+def collect():
+    """Totals for every process sharing METRICS_DIR, or just this one."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return registry.snapshot()
+    registry.flush(force=True)
+    snapshots = []
+    for filename in os.listdir(directory):
+        if filename.startswith('metrics-') and filename.endswith('.json'):
+            try:
+                with open(os.path.join(directory, filename)) as fp:
+                    snapshots.append(json.load(fp))
+            except (OSError, ValueError):
+                continue  # Removed or replaced while listing.
+    return merge(snapshots)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(values):
+    """The Prometheus text exposition of ``values``."""
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        full_name = PREFIX + name
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        for key, row in sorted(values.get(name, {}).items()):
+            label_values = json.loads(key)
+            if kind == 'counter':
+                lines.append(f'{full_name}{_labels(label_names, label_values)} {row}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), row[:-1]):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{_labels(label_names, label_values, [("le", bound)])} {cumulative}')
+            lines.append(f'{full_name}_sum{_labels(label_names, label_values)} {row[-1]}')
+            lines.append(f'{full_name}_count{_labels(label_names, label_values)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query's time to the current request's sample."""
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_seconds += time.perf_counter() - started
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """``connection_created`` receiver adding ``time_query`` to the connection once."""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render for the metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsMiddleware:
+    """
+    Record the metrics above for every request. Put it first in MIDDLEWARE.
+    Works in both sync and async chains; the sample is a context variable,
+    so queries run by sync code under ASGI still add to it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = RequestSample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, elapsed, sample)
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, elapsed, sample)
+
+    def record(self, request, response, elapsed, sample):
+        match = getattr(request, 'resolver_match', None)
+        # URL names only, never paths, so the number of series stays bounded.
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        size = None if response.streaming else len(response.content)
+        registry.record_request(view, method, response.status_code, elapsed, size, sample)
+        registry.flush()
+        return response
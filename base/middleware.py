@@ -0,0 +1,49 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import pin_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'primary_pin'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pin reads to the primary database for unsafe requests and, through a
+    short-lived cookie, for the same client's requests right after them.
+    Works in both sync and async chains, so async views such as the event
+    stream are not pushed into a thread under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pin_primary(self.pinned(request)):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        # The pin is a context variable, so it follows the view into sync_to_async threads.
+        with pin_primary(self.pinned(request)):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def pinned(self, request):
+        return request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,91 @@
+from django.db import migrations
+
+# The index tables as of this migration. Frozen here rather than imported
+# from base.search, so later changes to that module cannot change what this
+# migration does; schema changes to the index need a migration of their own.
+ROOM_TABLE = 'base_room_search'
+MESSAGE_TABLE = 'base_message_search'
+
+CREATE_SQL = {
+    'sqlite': [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {ROOM_TABLE} USING fts5('
+        f'name, topic, description, tokenize="unicode61 remove_diacritics 2")',
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {MESSAGE_TABLE} USING fts5('
+        f'body, tokenize="unicode61 remove_diacritics 2")',
+    ],
+    'postgresql': [
+        f'CREATE TABLE IF NOT EXISTS {ROOM_TABLE} (id bigint PRIMARY KEY, document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {ROOM_TABLE}_document_gin ON {ROOM_TABLE} USING GIN (document)',
+        f'CREATE TABLE IF NOT EXISTS {MESSAGE_TABLE} (id bigint PRIMARY KEY, document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {MESSAGE_TABLE}_document_gin ON {MESSAGE_TABLE} USING GIN (document)',
+    ],
+}
+
+INSERT_SQL = {
+    'sqlite': {
+        ROOM_TABLE: f'INSERT INTO {ROOM_TABLE} (rowid, name, topic, description) VALUES (%s, %s, %s, %s)',
+        MESSAGE_TABLE: f'INSERT INTO {MESSAGE_TABLE} (rowid, body) VALUES (%s, %s)',
+    },
+    'postgresql': {
+        ROOM_TABLE: (
+            f"INSERT INTO {ROOM_TABLE} (id, document) VALUES (%s, "
+            f"setweight(to_tsvector('simple', %s), 'A') || "
+            f"setweight(to_tsvector('simple', %s), 'B') || "
+            f"setweight(to_tsvector('simple', %s), 'C'))"
+        ),
+        MESSAGE_TABLE: (
+            f"INSERT INTO {MESSAGE_TABLE} (id, document) VALUES (%s, "
+            f"setweight(to_tsvector('simple', %s), 'A'))"
+        ),
+    },
+}
+
+BATCH_SIZE = 1000
+
+
+def _insert(cursor, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(tuple(value or '' for value in row))
+        if len(batch) >= BATCH_SIZE:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in CREATE_SQL:
+        return
+    alias = connection.alias
+    Room = apps.get_model('base', 'Room')
+    Message = apps.get_model('base', 'Message')
+    rooms = Room.objects.using(alias).order_by('pk').values_list('pk', 'name', 'topic__name', 'description')
+    messages = Message.objects.using(alias).order_by('pk').values_list('pk', 'body')
+    insert = INSERT_SQL[connection.vendor]
+    with connection.cursor() as cursor:
+        for sql in CREATE_SQL[connection.vendor]:
+            cursor.execute(sql)
+        # Index the rows that already exist; from here on the signal handlers keep it current.
+        _insert(cursor, insert[ROOM_TABLE], rooms.iterator(chunk_size=BATCH_SIZE))
+        _insert(cursor, insert[MESSAGE_TABLE], messages.iterator(chunk_size=BATCH_SIZE))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in CREATE_SQL:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in (ROOM_TABLE, MESSAGE_TABLE):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_alter_user_avatar'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
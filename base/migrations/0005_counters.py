@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_of(queryset, fk):
+    counts = queryset.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    # Self-contained rather than calling base.counters.reconcile(), which
+    # may change along with later models.
+    alias = schema_editor.connection.alias
+    Room = apps.get_model('base', 'Room')
+    Topic = apps.get_model('base', 'Topic')
+    Message = apps.get_model('base', 'Message')
+    Room.objects.using(alias).update(
+        participant_count=_count_of(Room.participants.through.objects.using(alias), 'room_id'),
+        message_count=_count_of(Message.objects.using(alias), 'room_id'),
+    )
+    Topic.objects.using(alias).update(room_count=_count_of(Room.objects.using(alias), 'topic_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='room_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'created'], name='base_msg_room_created_idx'),
+        ),
+    ]
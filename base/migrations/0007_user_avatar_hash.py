@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_message_room_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_user_avatar_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='moderation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('flagged', 'Flagged'), ('hidden', 'Hidden')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('moderation_status', 'pending')), fields=['id'], name='base_msg_pending_idx'),
+        ),
+    ]
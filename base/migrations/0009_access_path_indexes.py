@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_message_moderation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-updated', '-created'], name='base_msg_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', '-updated', '-created'], name='base_msg_room_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user', '-updated', '-created'], name='base_msg_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['-updated', '-created', '-id'], name='base_room_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['topic', '-updated', '-created'], name='base_room_topic_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['host', '-updated', '-created'], name='base_room_host_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['name'], name='base_room_name_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.TextField()),
+                ('moderation_status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('flagged', 'Flagged'), ('hidden', 'Hidden')], default='pending', max_length=10)),
+                ('updated', models.DateTimeField()),
+                ('created', models.DateTimeField()),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='base.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-updated', '-created'],
+                'indexes': [models.Index(fields=['room', 'created'], name='base_archmsg_room_created_idx'), models.Index(fields=['created'], name='base_archmsg_created_idx')],
+            },
+        ),
+    ]
@@ -7,6 +7,8 @@ import uuid
 from django.conf import settings
 # This is for handling fallback when calling for avatar url
 from django.conf import settings
+from django.core.cache import cache
+import functools
 import os
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -42,6 +44,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     bio = models.TextField(_('bio'), blank=True)
     avatar = models.ImageField(_('avatar'), upload_to='avatars/', null=True, blank=True)
+    # Content hash naming the thumbnail directory (see base.avatars); empty until generated.
+    avatar_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
 
     objects = CustomUserManager()
 
@@ -67,6 +71,27 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @property
     def avatar_url(self):
+        """
+        URL of the user's avatar, or of the default one. Resolving it stats
+        files, so the result is cached per user (see ``avatar_cache_key``)
+        and dropped when the user is saved or reloaded.
+        """
+        url = self.__dict__.get('_avatar_url')
+        if url is None:
+            key = avatar_cache_key(self.pk)
+            url = cache.get(key)
+            if url is None:
+                url = self._resolve_avatar_url()
+                cache.set(key, url, getattr(settings, 'AVATAR_URL_CACHE_TIMEOUT', 60 * 60 * 24))
+            self._avatar_url = url
+        return url
+
+    def refresh_from_db(self, *args, **kwargs):
+        # The reloaded avatar may differ from the one avatar_url resolved.
+        self.__dict__.pop('_avatar_url', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    def _resolve_avatar_url(self):
         if self.avatar and hasattr(self.avatar, 'url'):
             try:
                 # Check if file exists
@@ -75,18 +100,30 @@ class User(AbstractBaseUser, PermissionsMixin):
             except ValueError:
                 # Handle case where file path is invalid
                 pass
-        
-        # Return default avatar path
-        default_path = os.path.join(settings.STATIC_URL, 'images/assets/avatar.svg')
-        # Make sure the default image exists
-        static_file_path = os.path.join(settings.STATIC_ROOT, 'images/assets/avatar.svg')
-        if os.path.exists(static_file_path):
-            return default_path
-        
-        # If all else fails, return a URL to a public placeholder service
-        return "https://ui-avatars.com/api/?name=User&background=random"
+        return default_avatar_url()
+
+
+def avatar_cache_key(user_id):
+    return f'avatar_url:{user_id}'
+
+
+@functools.lru_cache(maxsize=None)
+def default_avatar_url():
+    # Return default avatar path
+    default_path = os.path.join(settings.STATIC_URL, 'images/assets/avatar.svg')
+    # Make sure the default image exists
+    static_file_path = os.path.join(settings.STATIC_ROOT, 'images/assets/avatar.svg')
+    if os.path.exists(static_file_path):
+        return default_path
+
+    # If all else fails, return a URL to a public placeholder service
+    return "https://ui-avatars.com/api/?name=User&background=random"
+
+
 class Topic(models.Model):
     name = models.CharField(max_length=200)
+    # Denormalized counter, maintained by base.counters
+    room_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -97,24 +134,97 @@ class Room(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(null =True,blank=True)
     participants = models.ManyToManyField(User, related_name='participants', blank=True)
+    # Denormalized counters, maintained by base.counters
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-updated', '-created']
+        indexes = [
+            # The home feed, in its keyset order; per topic and per host (profile page)
+            models.Index(fields=['-updated', '-created', '-id'], name='base_room_updated_idx'),
+            models.Index(fields=['topic', '-updated', '-created'], name='base_room_topic_updated_idx'),
+            models.Index(fields=['host', '-updated', '-created'], name='base_room_host_updated_idx'),
+            # create_room's "name already taken" check
+            models.Index(fields=['name'], name='base_room_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class MessageQuerySet(models.QuerySet):
+    def visible(self):
+        """Messages that moderation has not hidden."""
+        return self.exclude(moderation_status=Message.HIDDEN)
+
+
 class Message(models.Model):
+    # Moderation states, set by the background worker in base.moderation
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    FLAGGED = 'flagged'
+    HIDDEN = 'hidden'
+    MODERATION_CHOICES = [
+        (PENDING, _('Pending')),
+        (APPROVED, _('Approved')),
+        (FLAGGED, _('Flagged')),
+        (HIDDEN, _('Hidden')),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE ,related_name ='messages')
     room = models.ForeignKey(Room, on_delete=models.CASCADE,related_name ='room_messages')
     body = models.TextField()
+    moderation_status = models.CharField(max_length=10, choices=MODERATION_CHOICES, default=PENDING)
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated', '-created']
+        indexes = [
+            # "Messages in a room since X" range scans
+            models.Index(fields=['room', 'created'], name='base_msg_room_created_idx'),
+            # Recent activity, in Meta.ordering: everywhere, per room and per user
+            models.Index(fields=['-updated', '-created'], name='base_msg_updated_idx'),
+            models.Index(fields=['room', '-updated', '-created'], name='base_msg_room_updated_idx'),
+            models.Index(fields=['user', '-updated', '-created'], name='base_msg_user_updated_idx'),
+            # The moderation worker's queue of unchecked messages
+            models.Index(
+                fields=['id'], name='base_msg_pending_idx',
+                condition=models.Q(moderation_status='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return self.body[0:50]
+
+
+class ArchivedMessage(models.Model):
+    """
+    Cold partition of Message: rows older than MESSAGE_ARCHIVE_AFTER_DAYS,
+    moved here in batches by base.archive with their ids unchanged. Every
+    archived message is older than every hot one, so a (created, pk) cursor
+    continues from one table into the other.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_messages')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='archived_messages')
+    body = models.TextField()
+    moderation_status = models.CharField(max_length=10, choices=Message.MODERATION_CHOICES, default=Message.PENDING)
+    updated = models.DateTimeField()
+    created = models.DateTimeField()
+
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-updated', '-created']
+        indexes = [
+            models.Index(fields=['room', 'created'], name='base_archmsg_room_created_idx'),
+            models.Index(fields=['created'], name='base_archmsg_created_idx'),
+        ]
 
     def __str__(self):
-        return self.body[0:50]
\ No newline at end of file
+        return self.body[0:50]
@@ -0,0 +1,162 @@
+"""
+Background moderation of message bodies.
+
+Messages are stored and published as soon as they are posted, with
+``moderation_status='pending'``. A worker pool (``manage.py
+moderate_messages``) takes pending rows in id order, checks the bodies
+with the compiled profanity matcher and marks them approved, or
+flagged/hidden depending on ``MODERATION_ACTION``. Hidden messages drop out
+of ``Message.objects.visible()`` and connected clients are told to remove
+them. Pending messages that were archived before their turn came are
+taken from ``ArchivedMessage`` the same way; ids are unique across both
+tables.
+
+The worker publishes its throughput to the cache; ``metrics()`` combines
+that with the live backlog and lag read from the database. Use a shared
+cache backend if the worker runs in a separate process from the site.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import fragments
+from .broker import get_broker
+from .messaging import deleted_payload, room_channel
+from .models import ArchivedMessage, Message
+from .utils import contains_profanity
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'moderation:metrics'
+MODELS = (Message, ArchivedMessage)
+
+
+def offending_status():
+    return Message.HIDDEN if getattr(settings, 'MODERATION_ACTION', 'hide') == 'hide' else Message.FLAGGED
+
+
+def moderate_batch(rows):
+    """
+    Moderate ``rows`` of (id, room_id, body). Returns the number of messages
+    that were flagged or hidden.
+    """
+    close_old_connections()
+    try:
+        flags = [contains_profanity(body) for _pk, _room_id, body in rows]
+        offending = [row for row, flagged in zip(rows, flags) if flagged]
+        approved = [pk for (pk, _room_id, _body), flagged in zip(rows, flags) if not flagged]
+        status = offending_status()
+
+        # update() rather than save(): approving must not bump Message.updated.
+        # Hidden rows do get a new ``updated`` (they are not listed anywhere) so
+        # that room ETags, which track the newest message update, change.
+        # Filtering on PENDING leaves rows a moderator changed meanwhile alone.
+        changes = {'moderation_status': status}
+        if status == Message.HIDDEN:
+            changes['updated'] = timezone.now()
+        with transaction.atomic():
+            for model in MODELS:
+                pending = model.objects.filter(moderation_status=Message.PENDING)
+                pending.filter(pk__in=approved).update(moderation_status=Message.APPROVED)
+                changed = pending.filter(pk__in=[pk for pk, _room_id, _body in offending]).update(**changes)
+                if changed and model is ArchivedMessage:
+                    # Room ETags track the hot table only; see base.conditional.
+                    fragments.bump(fragments.ARCHIVE)
+
+        if status == Message.HIDDEN and offending:
+            fragments.bump(fragments.MESSAGES)
+            broker = get_broker()
+            for pk, room_id, _body in offending:
+                broker.publish(room_channel(room_id), deleted_payload(Message(pk=pk, room_id=room_id)))
+        return len(offending)
+    finally:
+        close_old_connections()
+
+
+class ModerationPool:
+    """
+    Fetch up to ``workers * batch_size`` pending messages, moderate them in
+    ``workers`` parallel batches, repeat. Each round finishes before the next
+    fetch, so no message is ever handed to two workers.
+    """
+
+    def __init__(self, workers=2, batch_size=500):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='moderation')
+        self.stopped = threading.Event()
+        self.processed = 0
+        self.offending = 0
+        self.started = time.monotonic()
+
+    def run_round(self):
+        """Moderate one round of pending messages; returns how many were processed."""
+        limit = self.workers * self.batch_size
+        rows = sorted(
+            row
+            for model in MODELS
+            for row in model.objects.filter(moderation_status=Message.PENDING)
+            .order_by('pk')
+            .values_list('pk', 'room_id', 'body', 'created')[:limit]
+        )[:limit]
+        if not rows:
+            self.record(0, 0, 0.0, None)
+            return 0
+
+        started = time.monotonic()
+        batches = [
+            [row[:3] for row in rows[i:i + self.batch_size]]
+            for i in range(0, len(rows), self.batch_size)
+        ]
+        offending = sum(self.executor.map(moderate_batch, batches))
+        elapsed = time.monotonic() - started
+        lag = (timezone.now() - min(row[3] for row in rows)).total_seconds()
+        self.record(len(rows), offending, elapsed, lag)
+        return len(rows)
+
+    def record(self, processed, offending, elapsed, lag):
+        self.processed += processed
+        self.offending += offending
+        cache.set(METRICS_KEY, {
+            'processed_total': self.processed,
+            'offending_total': self.offending,
+            'last_round_size': processed,
+            'last_round_rate': round(processed / elapsed, 1) if elapsed else 0.0,
+            'average_rate': round(self.processed / max(time.monotonic() - self.started, 1e-6), 1),
+            'last_round_lag_seconds': lag,
+            'workers': self.workers,
+            'updated_at': timezone.now().isoformat(),
+        }, None)
+
+    def run(self, interval=1.0):
+        """Moderate until ``stop()``; sleeps ``interval`` seconds whenever the queue is empty."""
+        while not self.stopped.is_set():
+            try:
+                if not self.run_round():
+                    self.stopped.wait(interval)
+            except Exception:
+                logger.exception("Moderation round failed")
+                self.stopped.wait(interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.executor.shutdown(wait=True)
+
+
+def metrics():
+    """Backlog and lag from the database plus the worker's last published throughput."""
+    pending = [model.objects.filter(moderation_status=Message.PENDING) for model in MODELS]
+    oldest = [queryset.order_by('pk').values_list('created', flat=True).first() for queryset in pending]
+    oldest = [created for created in oldest if created is not None]
+    return {
+        'pending': sum(queryset.count() for queryset in pending),
+        'lag_seconds': (timezone.now() - min(oldest)).total_seconds() if oldest else 0.0,
+        'worker': cache.get(METRICS_KEY),
+    }
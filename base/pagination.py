@@ -0,0 +1,166 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` plus a ``COUNT(*)``, each page is fetched with a
+``WHERE (ordering columns) < (last row seen)`` filter, so deep pages cost
+the same as the first one. Cursors are signed, so they are opaque to the
+client and cannot be forged into arbitrary filters.
+"""
+
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+CURSOR_SALT = 'base.pagination.cursor'
+
+
+def encode_cursor(values, direction):
+    return signing.dumps({'k': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """Return (values, direction) for a cursor token, or (None, 'next') if it is missing or invalid."""
+    if not token:
+        return None, 'next'
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        return list(data['k']), 'prev' if data['d'] == 'prev' else 'next'
+    except (signing.BadSignature, KeyError, TypeError):
+        return None, 'next'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` on ``ordering``, which must end with a unique
+    column (normally the pk) so that every row has a distinct key.
+
+    ``older`` is an optional second queryset whose rows all sort after
+    those of ``queryset``, such as archived messages; pages continue into
+    it once ``queryset`` runs out, and it is only queried then.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-updated', '-created', '-pk'), older=None):
+        self.queryset = queryset
+        self.older = older
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def _key(self, obj):
+        values = []
+        for field in self.fields:
+            value = getattr(obj, 'pk' if field == 'pk' else field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return values
+
+    def _beyond(self, values, reverse):
+        """Rows strictly after ``values`` in the ordering (before it if ``reverse``)."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            step = Q(**{f'{self.fields[i]}__{"lt" if descending else "gt"}': values[i]})
+            for name, value in zip(self.fields[:i], values):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        values, direction = decode_cursor(cursor)
+        if values is not None and len(values) != len(self.fields):
+            values, direction = None, 'next'
+        reverse = direction == 'prev'
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        sources = [self.queryset] if self.older is None else [self.queryset, self.older]
+        if reverse:
+            sources.reverse()
+
+        # One extra row tells us whether there is anything past this page.
+        rows = []
+        for source in sources:
+            queryset = source.order_by(*ordering)
+            if values is not None:
+                queryset = queryset.filter(self._beyond(values, reverse))
+            rows.extend(queryset[:self.per_page + 1 - len(rows)])
+            if len(rows) > self.per_page:
+                break
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self._key(rows[-1]), 'next')
+            if (has_more and reverse) or (values is not None and not reverse):
+                previous_cursor = encode_cursor(self._key(rows[0]), 'prev')
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class OffsetCursorPaginator:
+    """
+    Cursor pagination over an already ranked, bounded list of ids, such as
+    the hits returned by ``base.search``. The cursor carries the offset.
+    """
+
+    def __init__(self, ids, per_page, load):
+        self.ids = ids
+        self.per_page = per_page
+        self.load = load
+
+    def page(self, cursor=None):
+        values, _direction = decode_cursor(cursor)
+        try:
+            offset = max(int(values[0]), 0) if values else 0
+        except (TypeError, ValueError):
+            offset = 0
+        end = offset + self.per_page
+        rows = list(self.load(self.ids[offset:end]))
+        next_cursor = encode_cursor([end], 'next') if end < len(self.ids) else None
+        previous_cursor = encode_cursor([max(offset - self.per_page, 0)], 'next') if offset else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def _count_key(key):
+    return 'count:' + hashlib.md5(key.encode()).hexdigest()
+
+
+def cached_count(queryset, key, timeout=60):
+    """
+    ``queryset.count()``, cached under ``key`` for ``timeout`` seconds. Good
+    enough for "N rooms available" labels, which do not need to be exact.
+    """
+    cache_key = _count_key(key)
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+def invalidate_count(key):
+    cache.delete(_count_key(key))
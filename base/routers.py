@@ -0,0 +1,66 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads go to a randomly chosen replica
+(any ``DATABASES`` alias other than ``default``), except when they must see
+the request's own writes:
+
+* inside a transaction on the primary;
+* during a request that is not GET/HEAD/OPTIONS;
+* for ``REPLICA_STICKY_SECONDS`` after such a request from the same
+  client, so the page a POST redirects to, e.g. the room a message was
+  just posted in, does not read from a replica that is still behind.
+
+``ReplicaRoutingMiddleware`` in ``base.middleware`` sets the pin for each
+request; ``pin_primary()`` does the same for code outside requests.
+"""
+
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+_pinned = contextvars.ContextVar('base_routers_pinned', default=False)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+def is_pinned():
+    return _pinned.get() or connections[PRIMARY].in_atomic_block
+
+
+@contextlib.contextmanager
+def pin_primary(pinned=True):
+    """Send reads in this block to the primary (or let them use replicas again)."""
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        aliases = replicas()
+        if not aliases or is_pinned():
+            return PRIMARY
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
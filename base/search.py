@@ -0,0 +1,262 @@
+"""
+Full-text search for rooms and messages.
+
+The index lives in side tables keyed by the id of the indexed row:
+FTS5 virtual tables on SQLite and ``tsvector`` tables with a GIN index on
+Postgres. Views only ever see ranked id lists, so they do not care which
+backend is in use. The tables are kept current by the signal handlers in
+``base.signals`` and can be rebuilt with ``manage.py rebuild_search_index``.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, When
+
+ROOM_TABLE = 'base_room_search'
+MESSAGE_TABLE = 'base_message_search'
+
+# Columns of each index table, most important first. On Postgres the
+# position decides the tsvector weight (A, B, C).
+COLUMNS = {
+    ROOM_TABLE: ('name', 'topic', 'description'),
+    MESSAGE_TABLE: ('body',),
+}
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+
+def result_limit():
+    return getattr(settings, 'SEARCH_RESULT_LIMIT', 200)
+
+
+def tokenize(q):
+    """Split a raw query into at most MAX_TERMS lowercase word terms."""
+    return WORD_RE.findall((q or '').lower())[:MAX_TERMS]
+
+
+class SQLiteBackend:
+    """FTS5 virtual tables; the FTS rowid is the indexed row's id."""
+
+    def create_tables(self, cursor):
+        for table, columns in COLUMNS.items():
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5('
+                f'{", ".join(columns)}, tokenize="unicode61 remove_diacritics 2")'
+            )
+
+    def drop_tables(self, cursor):
+        for table in COLUMNS:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def upsert(self, cursor, table, rows):
+        columns = COLUMNS[table]
+        self.delete(cursor, table, [row[0] for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+            f'VALUES (%s{", %s" * len(columns)})',
+            [(pk, *(value or '' for value in values)) for pk, *values in rows],
+        )
+
+    def delete(self, cursor, table, ids):
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def clear(self, cursor, table):
+        cursor.execute(f'DELETE FROM {table}')
+
+    def search(self, cursor, table, terms, limit):
+        # Every term is a bare word, so quoting it and adding * gives a safe
+        # prefix query; space-separated phrases are ANDed by FTS5.
+        match = ' '.join(f'"{term}"*' for term in terms)
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+            f'ORDER BY bm25({table}) LIMIT %s',
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    """Weighted ``tsvector`` documents with a GIN index."""
+
+    config = 'simple'
+    weights = 'ABC'
+
+    def create_tables(self, cursor):
+        for table in COLUMNS:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} '
+                f'(id bigint PRIMARY KEY, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_document_gin '
+                f'ON {table} USING GIN (document)'
+            )
+
+    def drop_tables(self, cursor):
+        for table in COLUMNS:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def upsert(self, cursor, table, rows):
+        document = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', %s), '{weight}')"
+            for weight, _ in zip(self.weights, COLUMNS[table])
+        )
+        cursor.executemany(
+            f'INSERT INTO {table} (id, document) VALUES (%s, {document}) '
+            f'ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document',
+            [(pk, *(value or '' for value in values)) for pk, *values in rows],
+        )
+
+    def delete(self, cursor, table, ids):
+        cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s)', [list(ids)])
+
+    def clear(self, cursor, table):
+        cursor.execute(f'TRUNCATE {table}')
+
+    def search(self, cursor, table, terms, limit):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        cursor.execute(
+            f"SELECT id FROM {table}, to_tsquery('{self.config}', %s) query "
+            f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s',
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgresBackend(),
+}
+
+
+def get_backend(connection):
+    """Return the search backend for a connection, or None if unsupported."""
+    return BACKENDS.get(connection.vendor)
+
+
+def room_row(room):
+    return (room.pk, room.name, room.topic.name if room.topic_id else '', room.description)
+
+
+def message_row(message):
+    return (message.pk, message.body)
+
+
+def _write(using, table, rows=(), delete_ids=()):
+    connection = connections[using]
+    backend = get_backend(connection)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        if rows:
+            backend.upsert(cursor, table, rows)
+        if delete_ids:
+            backend.delete(cursor, table, delete_ids)
+
+
+def index_rooms(rooms, using='default'):
+    _write(using, ROOM_TABLE, rows=[room_row(room) for room in rooms])
+
+
+def index_messages(messages, using='default'):
+    _write(using, MESSAGE_TABLE, rows=[message_row(message) for message in messages])
+
+
+def unindex_rooms(ids, using='default'):
+    _write(using, ROOM_TABLE, delete_ids=list(ids))
+
+
+def unindex_messages(ids, using='default'):
+    _write(using, MESSAGE_TABLE, delete_ids=list(ids))
+
+
+def _search(table, q, limit, using):
+    connection = connections[using]
+    backend = get_backend(connection)
+    terms = tokenize(q)
+    if backend is None or not terms:
+        return None
+    with connection.cursor() as cursor:
+        return backend.search(cursor, table, terms, limit or result_limit())
+
+
+def search_room_ids(q, limit=None, using='default'):
+    """
+    Return ids of rooms matching ``q`` by name, topic or description, best
+    match first. Returns None when the query has no searchable terms or the
+    database has no search backend, so callers can fall back to the ORM.
+    """
+    return _search(ROOM_TABLE, q, limit, using)
+
+
+def search_message_ids(q, limit=None, using='default'):
+    """Return ids of messages whose body matches ``q``, best match first."""
+    return _search(MESSAGE_TABLE, q, limit, using)
+
+
+def in_rank_order(queryset, ids):
+    """Restrict ``queryset`` to ``ids`` and order it the way ``ids`` is ordered."""
+    if not ids:
+        return queryset.none()
+    rank = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(rank)
+
+
+def search_rooms(queryset, q, using='default'):
+    """Ranked rooms matching ``q``; falls back to icontains without a backend."""
+    ids = search_room_ids(q, using=using)
+    if ids is None:
+        return queryset.filter(
+            Q(topic__name__icontains=q) | Q(name__icontains=q) | Q(description__icontains=q)
+        )
+    return in_rank_order(queryset, ids)
+
+
+def search_messages(queryset, q, using='default'):
+    """
+    Messages whose body matches ``q`` or that were posted in a room matching
+    ``q``. Keeps the queryset's own (most recent first) ordering.
+    """
+    message_ids = search_message_ids(q, using=using)
+    room_ids = search_room_ids(q, using=using)
+    if message_ids is None or room_ids is None:
+        return queryset.filter(
+            Q(room__topic__name__icontains=q) | Q(room__name__icontains=q) | Q(body__icontains=q)
+        )
+    return queryset.filter(Q(pk__in=message_ids) | Q(room_id__in=room_ids))
+
+
+def rebuild(room_model, message_model, using='default', batch_size=1000):
+    """
+    Drop everything in the index and re-add every room and message.
+    Takes the models as arguments so migrations can pass historical models.
+    Returns the number of (rooms, messages) indexed.
+    """
+    connection = connections[using]
+    backend = get_backend(connection)
+    if backend is None:
+        return 0, 0
+    counts = []
+    sources = (
+        (ROOM_TABLE, room_model.objects.using(using).select_related('topic'), room_row),
+        (MESSAGE_TABLE, message_model.objects.using(using).only('pk', 'body'), message_row),
+    )
+    with connection.cursor() as cursor:
+        backend.create_tables(cursor)
+        for table, queryset, to_row in sources:
+            backend.clear(cursor, table)
+            total, batch = 0, []
+            for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(to_row(obj))
+                if len(batch) >= batch_size:
+                    backend.upsert(cursor, table, batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                backend.upsert(cursor, table, batch)
+                total += len(batch)
+            counts.append(total)
+    return tuple(counts)
@@ -0,0 +1,88 @@
+"""
+Session backend that keeps the database out of the request path.
+
+Reads come from the session cache (``SESSION_CACHE_ALIAS``) and only fall
+back to the ``django_session`` table on a miss, as with Django's
+``cached_db`` backend. On top of that, a save whose data is identical to
+what was loaded is dropped: logins, flash messages and views that assign
+a key its current value mark the session modified without changing it,
+and on SQLite each of those writes queues behind message posting.
+
+The cache is only used when every worker process sees the same one
+(``CACHE_URL``, see ``base.checks``). A per-process cache would keep
+serving a session that another worker has logged out or flushed, so
+without a shared cache sessions are read from the table, like the ``db``
+backend.
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from .checks import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(CachedDBStore):
+    _loaded_state = None
+
+    @property
+    def use_cache(self):
+        return is_shared_cache(settings.SESSION_CACHE_ALIAS)
+
+    def _state(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load() if self.use_cache else DBStore.load(self)
+        self._loaded_state = self._state(data)
+        return data
+
+    def exists(self, session_key):
+        return super().exists(session_key) if self.use_cache else DBStore.exists(self, session_key)
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and self._loaded_state is not None
+            and self._state(self._get_session()) == self._loaded_state
+        ):
+            return
+        DBStore.save(self, must_create)
+        self._loaded_state = self._state(self._session)
+        if not self.use_cache:
+            return
+        try:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        except Exception:
+            # The row is saved; loads fall back to the database on a miss.
+            logger.warning("Could not cache session", exc_info=True)
+
+    def delete(self, session_key=None):
+        if self.use_cache:
+            super().delete(session_key)
+        else:
+            DBStore.delete(self, session_key)
+        self._loaded_state = None
+
+    @classmethod
+    def clear_expired(cls, batch_size=1000):
+        """
+        Delete expired sessions ``batch_size`` rows at a time, so the purge
+        never holds the table for long. Returns the number deleted.
+        Cached copies expire on their own at the same time.
+        """
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        total = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return total
+            deleted, _ = Session.objects.filter(session_key__in=keys).delete()
+            total += deleted
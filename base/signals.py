@@ -0,0 +1,206 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, fragments, search
+from .broker import get_broker
+from .messaging import deleted_payload, message_payload, room_channel
+from .pagination import invalidate_count
+from .models import ArchivedMessage, Message, Room, Topic, User, avatar_cache_key
+
+
+# Search index: keep the FTS/tsvector side tables in step with the rows.
+
+@receiver(post_save, sender=Room)
+def index_room(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        search.index_rooms([instance], using=using)
+
+
+@receiver(post_delete, sender=Room)
+def unindex_room(sender, instance, using='default', **kwargs):
+    search.unindex_rooms([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        search.index_messages([instance], using=using)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, using='default', **kwargs):
+    search.unindex_messages([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Topic)
+def reindex_topic_rooms(sender, instance, created, raw=False, using='default', **kwargs):
+    # Room documents embed the topic name, so a rename touches every room.
+    if not created and not raw:
+        search.index_rooms(instance.room_topic.using(using).select_related('topic'), using=using)
+
+
+@receiver(pre_delete, sender=Topic)
+def remember_topic_rooms(sender, instance, using='default', **kwargs):
+    # The FK is SET_NULL via a bulk update, so grab the rooms before it runs.
+    instance._search_room_ids = list(instance.room_topic.using(using).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Topic)
+def reindex_orphaned_rooms(sender, instance, using='default', **kwargs):
+    room_ids = getattr(instance, '_search_room_ids', [])
+    if room_ids:
+        search.index_rooms(Room.objects.using(using).filter(pk__in=room_ids), using=using)
+
+
+# Feed pagination: the unfiltered "N rooms available" count changes only
+# when a room is added or removed.
+
+@receiver(post_save, sender=Room)
+def invalidate_room_count(sender, instance, created, **kwargs):
+    if created:
+        invalidate_count('rooms:')
+
+
+@receiver(post_delete, sender=Room)
+def invalidate_room_count_on_delete(sender, instance, **kwargs):
+    invalidate_count('rooms:')
+
+
+# Denormalized counters (base.counters).
+
+@receiver(pre_save, sender=Room)
+def remember_room_topic(sender, instance, raw=False, using='default', **kwargs):
+    instance._previous_topic_id = None
+    if instance.pk and not instance._state.adding and not raw:
+        instance._previous_topic_id = (
+            Room.objects.using(using).filter(pk=instance.pk).values_list('topic_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Room)
+def count_room_topic(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created:
+        counters.adjust(Topic, instance.topic_id, 'room_count', 1, using)
+        return
+    previous = getattr(instance, '_previous_topic_id', None)
+    if previous != instance.topic_id:
+        counters.adjust(Topic, previous, 'room_count', -1, using)
+        counters.adjust(Topic, instance.topic_id, 'room_count', 1, using)
+
+
+@receiver(post_delete, sender=Room)
+def uncount_room_topic(sender, instance, using='default', **kwargs):
+    counters.adjust(Topic, instance.topic_id, 'room_count', -1, using)
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, raw=False, using='default', **kwargs):
+    if created and not raw:
+        counters.adjust(Room, instance.room_id, 'message_count', 1, using)
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=ArchivedMessage)
+def uncount_message(sender, instance, using='default', **kwargs):
+    # Room.message_count includes archived messages (see base.archive).
+    counters.adjust(Room, instance.room_id, 'message_count', -1, using)
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_rooms(sender, instance, using='default', **kwargs):
+    # Memberships are removed by a plain cascade, which sends no m2m_changed.
+    instance._participant_room_ids = list(instance.participants.using(using).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def recount_user_rooms(sender, instance, using='default', **kwargs):
+    counters.recount_participants(Room, getattr(instance, '_participant_room_ids', []), using)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def count_participants(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action == 'post_add' and not reverse:
+        # pk_set holds only the users that were actually inserted.
+        counters.adjust(Room, instance.pk, 'participant_count', len(pk_set), using)
+    elif action == 'post_add':
+        for room_id in pk_set:
+            counters.adjust(Room, room_id, 'participant_count', 1, using)
+    elif action in ('post_remove', 'post_clear') and not reverse:
+        counters.recount_participants(Room, [instance.pk], using)
+    elif action == 'post_remove':
+        counters.recount_participants(Room, pk_set, using)
+    elif action == 'pre_clear' and reverse:
+        # Clearing from the user side: remember which rooms are affected.
+        instance._cleared_room_ids = list(instance.participants.using(using).values_list('pk', flat=True))
+    elif action == 'post_clear':
+        counters.recount_participants(Room, getattr(instance, '_cleared_room_ids', []), using)
+
+
+# Real-time delivery: push new and deleted messages to room subscribers
+# once the write is committed.
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, raw=False, using='default', **kwargs):
+    if created and not raw:
+        payload = message_payload(instance)
+        transaction.on_commit(
+            lambda: get_broker().publish(room_channel(instance.room_id), payload), using=using
+        )
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=ArchivedMessage)
+def publish_message_deleted(sender, instance, using='default', **kwargs):
+    payload = deleted_payload(instance)
+    transaction.on_commit(
+        lambda: get_broker().publish(room_channel(instance.room_id), payload), using=using
+    )
+
+
+# Avatar URLs are cached per user; a save may have replaced the avatar.
+
+@receiver(post_save, sender=User)
+def invalidate_avatar_url(sender, instance, **kwargs):
+    cache.delete(avatar_cache_key(instance.pk))
+    instance.__dict__.pop('_avatar_url', None)
+
+
+# Fragment cache versions (base.fragments). Topic room counts and feed
+# participant counts are counters on these rows, so room and membership
+# changes bump the topic and room versions too.
+
+@receiver([post_save, post_delete], sender=Topic)
+def bump_topic_fragments(sender, using='default', **kwargs):
+    fragments.bump(fragments.TOPICS, fragments.ROOMS, using=using)
+
+
+@receiver([post_save, post_delete], sender=Room)
+def bump_room_fragments(sender, using='default', **kwargs):
+    fragments.bump(fragments.ROOMS, fragments.TOPICS, fragments.MESSAGES, using=using)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def bump_participant_fragments(sender, action, using='default', **kwargs):
+    if action.startswith('post_'):
+        fragments.bump(fragments.ROOMS, using=using)
+
+
+@receiver([post_save, post_delete], sender=Message)
+def bump_message_fragments(sender, using='default', **kwargs):
+    fragments.bump(fragments.MESSAGES, using=using)
+
+
+@receiver(post_delete, sender=ArchivedMessage)
+def bump_archive_fragments(sender, using='default', **kwargs):
+    fragments.bump(fragments.MESSAGES, fragments.ARCHIVE, using=using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def bump_user_fragments(sender, using='default', update_fields=None, **kwargs):
+    # Logging in saves last_login only, which no fragment shows.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        fragments.bump(fragments.USERS, using=using)
@@ -0,0 +1,111 @@
+"""
+Settings for running production traffic on a single SQLite file.
+
+Every new SQLite connection gets the ``SQLITE_PRAGMAS`` from settings:
+WAL lets readers keep going while a write commits, ``busy_timeout`` makes
+a writer wait for the lock instead of failing with "database is
+locked", and ``mmap_size`` serves reads from the page cache.
+
+SQLite allows one writer at a time, so many request threads each running
+their own short write transaction mostly queue for the lock.
+``WriteQueue`` funnels such writes through one thread per process, which
+commits everything queued so far in a single transaction.
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver applying SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class WriteTimeout(Exception):
+    """The item waited ``timeout`` seconds in the queue and was dropped unwritten."""
+
+
+class WriteQueue:
+    """
+    A single writer thread. ``submit(item)`` blocks until ``handler`` has
+    committed the item together with whatever else was queued meanwhile,
+    up to ``batch_size`` items, and returns the handler's result for it.
+    ``handler(items)`` must be atomic and return one result per item.
+
+    An item still queued after ``timeout`` seconds is cancelled, so the
+    writer skips it, and ``submit`` raises ``WriteTimeout``; one whose
+    commit has already started is waited for instead.
+    """
+
+    def __init__(self, handler, batch_size=100, timeout=10):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        self._start()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteTimeout from None
+            return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # No waiting: the batch is whatever queued up during the last commit.
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Drops items whose submitter gave up waiting; the rest can no longer be cancelled.
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            close_old_connections()
+            self._commit(batch)
+            self.batches += 1
+            self.items += len(batch)
+
+    def _commit(self, batch):
+        try:
+            results = self.handler([item for item, _future in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                batch[0][1].set_exception(exc)
+                return
+            # One bad item must not fail the others: retry them one by one.
+            logger.warning("Grouped write failed, retrying %d items separately", len(batch), exc_info=True)
+            for entry in batch:
+                self._commit([entry])
+            return
+        for (_item, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,193 @@
+"""
+Synthetic datasets shaped like production: few busy rooms and many quiet
+ones, a handful of prolific posters and a long tail of lurkers.
+
+Room activity, posting users, hosts and topics are all drawn from Zipf
+distributions, so the hot-row and index-skew effects that only show up at
+scale are reproduced locally. The same ``seed`` always gives the same data.
+
+Rows are written with ``bulk_create`` in batches (signals do not fire);
+counters, room ``updated`` times and the search index are fixed up once at
+the end, as in ``base.loader``.
+"""
+
+import bisect
+import itertools
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import counters, fragments, loader, search
+from .models import ArchivedMessage, Message, Room, Topic, User
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+DEFAULT_PASSWORD = 'loadtest'
+WORDS = (
+    'python django rust design sql index cache query latency queue thread async '
+    'deploy release review bug fix test docs api room topic message user profile '
+    'feed search page cursor batch worker pool replica primary session token '
+    'the a to and of is it that for on with this as are be at have not you'
+).split()
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights for ranks 1..n with P(rank k) proportional to 1/k**exponent."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+class ZipfChooser:
+    """Draw items with Zipf-distributed popularity; the first items are the most popular."""
+
+    def __init__(self, items, exponent, rng):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = zipf_cum_weights(len(items), exponent)
+
+    def __call__(self):
+        x = self.rng.random() * self.cum_weights[-1]
+        return self.items[bisect.bisect(self.cum_weights, x)]
+
+
+# Word frequencies in text are themselves roughly Zipfian.
+_WORD_WEIGHTS = zipf_cum_weights(len(WORDS), 1.0)
+
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choices(WORDS, cum_weights=_WORD_WEIGHTS, k=rng.randint(low, high)))
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _insert(model, objects, batch_size, using, report):
+    started, total = time.monotonic(), 0
+    for batch in _batched(objects, batch_size):
+        with transaction.atomic(using=using):
+            model.objects.using(using).bulk_create(batch)
+        total += len(batch)
+    if report:
+        report(model._meta.label_lower, total, time.monotonic() - started)
+    return total
+
+
+def generate(users=1000, rooms=500, messages=100_000, topics=100, exponent=1.1, days=365,
+             seed=0, password=DEFAULT_PASSWORD, batch_size=5000, using='default',
+             index=True, report=None):
+    """
+    Add a dataset of the given size to the database. Users get emails
+    ``user<N>.<seed>@loadtest.invalid`` and all share ``password`` so the load
+    harness can log in as them. Returns the seed used.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    window = (now - start).total_seconds()
+    run = f'{seed:x}'
+
+    # Hashing is deliberately slow; every account gets the same hash.
+    password_hash = make_password(password)
+    user_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(users)]
+    _insert(User, (
+        User(
+            id=pk,
+            email=f'user{i}.{run}@{EMAIL_DOMAIN}',
+            username=f'user{i}_{run}',
+            password=password_hash,
+            date_joined=start + timedelta(seconds=rng.random() * window),
+        )
+        for i, pk in enumerate(user_ids)
+    ), batch_size, using, report)
+
+    first_topic = (Topic.objects.using(using).aggregate(n=Max('pk'))['n'] or 0) + 1
+    topic_ids = list(range(first_topic, first_topic + topics))
+    _insert(Topic, (
+        Topic(id=pk, name=f'{WORDS[i % len(WORDS)].title()} {pk}') for i, pk in enumerate(topic_ids)
+    ), batch_size, using, report)
+
+    # Rooms are drawn in popularity order: room_ids[0] gets the most messages.
+    first_room = (Room.objects.using(using).aggregate(n=Max('pk'))['n'] or 0) + 1
+    room_ids = list(range(first_room, first_room + rooms))
+    room_created = [start + timedelta(seconds=rng.random() * window * 0.9) for _ in room_ids]
+    pick_host = ZipfChooser(user_ids, exponent, rng)
+    pick_topic = ZipfChooser(topic_ids, exponent, rng)
+    with loader.keep_timestamps((Room,)):
+        _insert(Room, (
+            Room(
+                id=pk,
+                host_id=pick_host(),
+                topic_id=pick_topic(),
+                name=f'{_sentence(rng, 1, 3).title()} {pk}',
+                description=_sentence(rng, 5, 25),
+                created=created,
+                updated=created,
+            )
+            for pk, created in zip(room_ids, room_created)
+        ), batch_size, using, report)
+
+    created_by_room = dict(zip(room_ids, room_created))
+    pick_room = ZipfChooser(room_ids, exponent, rng)
+    pick_poster = ZipfChooser(user_ids, exponent, rng)
+
+    # Messages dominate the run, so they skip model instances and go
+    # straight to executemany; bulk_create spends most of its time in
+    # the ORM at this scale.
+    connection = connections[using]
+    adapt = connection.ops.adapt_datetimefield_value
+    uuid_as_hex = not connection.features.has_native_uuid_field
+    qn = connection.ops.quote_name
+    columns = ('user_id', 'room_id', 'body', 'moderation_status', 'updated', 'created')
+    insert_sql = (
+        f'INSERT INTO {qn(Message._meta.db_table)} ({", ".join(map(qn, columns))}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))})'
+    )
+
+    def message_rows():
+        for _ in range(messages):
+            room_id = pick_room()
+            room_start = created_by_room[room_id]
+            created = adapt(room_start + (now - room_start) * rng.random())
+            yield (pick_poster().hex if uuid_as_hex else pick_poster(),
+                   room_id, _sentence(rng, 3, 40), Message.APPROVED, created, created)
+
+    started, total = time.monotonic(), 0
+    through = Room.participants.through
+    for batch in _batched(message_rows(), batch_size):
+        participants = {(user_id, room_id) for user_id, room_id, *_ in batch}
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.executemany(insert_sql, batch)
+            through.objects.using(using).bulk_create(
+                [through(room_id=room_id, user_id=user_id) for user_id, room_id in participants],
+                ignore_conflicts=True,
+            )
+        total += len(batch)
+    if report:
+        report('base.message', total, time.monotonic() - started)
+
+    started = time.monotonic()
+    loader.reset_sequences((Topic, Room), using)
+    last_message = (
+        Message.objects.using(using).filter(room=OuterRef('pk'))
+        .order_by('-created').values('created')[:1]
+    )
+    Room.objects.using(using).filter(pk__gte=first_room, pk__lt=first_room + rooms).update(
+        updated=Coalesce(Subquery(last_message), F('created')),
+    )
+    with transaction.atomic(using=using):
+        counters.reconcile(Room, Topic, Message, using=using, archive_model=ArchivedMessage)
+    if index:
+        search.rebuild(Room, Message, using=using, batch_size=batch_size)
+    fragments.bump(*fragments.NAMES, using=using)
+    if report:
+        report('counters and search index' if index else 'counters', None, time.monotonic() - started)
+    return seed
@@ -0,0 +1,17 @@
+from django import template
+
+from base.avatars import avatar_for
+
+register = template.Library()
+
+
+@register.filter
+def avatar(user, size='small'):
+    """
+    URL of a thumbnail of ``user``'s avatar: ``{{ user|avatar:"small" }}``.
+    Append ``.jpg`` to the size for a JPEG instead of WebP.
+    """
+    if user is None:
+        return ''
+    size, _, fmt = size.partition('.')
+    return avatar_for(user, size, fmt or 'webp')
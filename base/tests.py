@@ -1,3 +1,1308 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from better_profanity import profanity
+from better_profanity.constants import ALLOWED_CHARACTERS
+from better_profanity.utils import get_complete_path_of_file, read_wordlist
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import archive, avatars, benchmarks, catalogue, checks, counters, fragments, hashing, loader, metrics, moderation, search, synthetic
+from .broker import RedisBroker
+from .sessions import SessionStore
+from .sqlite import WriteQueue, WriteTimeout
+from .utils import contains_profanity
+from .websocket import CLOSE_NOT_FOUND, websocket_application
+from .messaging import post_message, post_messages
+from .pagination import decode_cursor
+from .middleware import STICKY_COOKIE, ReplicaRoutingMiddleware
+from .routers import is_pinned, pin_primary
+from .models import ArchivedMessage, Message, Room, Topic, User, default_avatar_url
+
+
+@skipUnless(search.get_backend(connection), "No full-text search backend for this database")
+class SearchTests(TestCase):
+    """The search index follows room, topic and message writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.python = Topic.objects.create(name='Python')
+        cls.room = Room.objects.create(host=cls.user, topic=cls.python, name='Async views', description='Django channels')
+        cls.other = Room.objects.create(host=cls.user, topic=cls.python, name='Packaging', description='async wheels')
+
+    def test_room_matches_name_topic_and_description(self):
+        self.assertEqual(search.search_room_ids('views'), [self.room.pk])
+        self.assertEqual(search.search_room_ids('channels'), [self.room.pk])
+        self.assertCountEqual(search.search_room_ids('python'), [self.room.pk, self.other.pk])
+
+    def test_terms_are_prefixes_and_anded(self):
+        self.assertEqual(search.search_room_ids('pack'), [self.other.pk])
+        self.assertEqual(search.search_room_ids('async pack'), [self.other.pk])
+        self.assertEqual(search.search_room_ids('async nothing'), [])
+
+    def test_no_terms_falls_back(self):
+        self.assertIsNone(search.search_room_ids('  !?  '))
+
+    def test_room_update_and_delete(self):
+        self.room.name = 'Sync views'
+        self.room.save()
+        self.assertEqual(search.search_room_ids('sync'), [self.room.pk])
+        self.room.delete()
+        self.assertEqual(search.search_room_ids('views'), [])
+
+    def test_topic_rename_reindexes_rooms(self):
+        self.python.name = 'Snakes'
+        self.python.save()
+        self.assertCountEqual(search.search_room_ids('snakes'), [self.room.pk, self.other.pk])
+        self.assertEqual(search.search_room_ids('python'), [])
+
+    def test_topic_delete_reindexes_rooms(self):
+        self.python.delete()
+        self.assertEqual(search.search_room_ids('python'), [])
+        self.assertEqual(search.search_room_ids('views'), [self.room.pk])
+
+    def test_messages(self):
+        message = Message.objects.create(user=self.user, room=self.room, body='Tracebacks in the worker')
+        self.assertEqual(search.search_message_ids('traceback'), [message.pk])
+        message.delete()
+        self.assertEqual(search.search_message_ids('traceback'), [])
+
+    def test_rebuild(self):
+        Message.objects.create(user=self.user, room=self.room, body='hello')
+        self.assertEqual(search.rebuild(Room, Message), (2, 1))
+        self.assertEqual(search.search_room_ids('views'), [self.room.pk])
+
+    def test_index_page(self):
+        response = self.client.get('/?q=packaging')
+        self.assertEqual([room.pk for room in response.context['rooms']], [self.other.pk])
+        self.assertContains(response, '1 Rooms available')
+
+    @override_settings(SEARCH_RESULT_LIMIT=1)
+    def test_index_page_count_at_the_limit(self):
+        self.assertContains(self.client.get('/?q=python'), '1+ Rooms available')
+
+
+class CounterTests(TestCase):
+    """The denormalized counters follow every write path, and reconcile() repairs drift."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.al = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.bo = User.objects.create_user(email='bo@example.com', password='pw', username='bo')
+        cls.python = Topic.objects.create(name='Python')
+        cls.rust = Topic.objects.create(name='Rust')
+        cls.room = Room.objects.create(host=cls.al, topic=cls.python, name='Async')
+
+    def assertCounts(self, messages, participants):
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.message_count, self.room.participant_count), (messages, participants))
+
+    def test_post_and_delete_message(self):
+        first = post_message(self.al, self.room, 'one')
+        post_message(self.al, self.room, 'two')
+        post_message(self.bo, self.room, 'three')
+        self.assertCounts(3, 2)
+        first.delete()
+        self.assertCounts(2, 2)
+
+    def test_archived_message_delete(self):
+        message = post_message(self.al, self.room, 'old')
+        ArchivedMessage.objects.create(
+            id=message.pk, user=self.al, room=self.room, body=message.body,
+            updated=message.updated, created=message.created,
+        )
+        Message.objects.filter(pk=message.pk)._raw_delete('default')
+        self.assertCounts(1, 1)
+        ArchivedMessage.objects.get(pk=message.pk).delete()
+        self.assertCounts(0, 1)
+
+    def test_user_delete(self):
+        post_message(self.al, self.room, 'one')
+        message = post_message(self.bo, self.room, 'two')
+        post_message(self.bo, self.room, 'three')
+        ArchivedMessage.objects.create(
+            user=self.bo, room=self.room, body='archived', updated=message.updated, created=message.created,
+        )
+        counters.adjust(Room, self.room.pk, 'message_count', 1)
+        self.assertCounts(4, 2)
+        self.bo.delete()
+        self.assertCounts(1, 1)
+
+    def test_participants(self):
+        self.room.participants.add(self.al, self.bo)
+        self.assertCounts(0, 2)
+        self.room.participants.remove(self.al)
+        self.assertCounts(0, 1)
+        self.bo.participants.clear()
+        self.assertCounts(0, 0)
+
+    def test_topic_change(self):
+        self.python.refresh_from_db()
+        self.assertEqual(self.python.room_count, 1)
+        self.room.topic = self.rust
+        self.room.save()
+        self.python.refresh_from_db()
+        self.rust.refresh_from_db()
+        self.assertEqual((self.python.room_count, self.rust.room_count), (0, 1))
+        self.room.delete()
+        self.rust.refresh_from_db()
+        self.assertEqual(self.rust.room_count, 0)
+
+    def test_reconcile(self):
+        post_message(self.al, self.room, 'one')
+        Room.objects.filter(pk=self.room.pk).update(message_count=7, participant_count=0)
+        Topic.objects.filter(pk=self.rust.pk).update(room_count=3)
+        fixed = counters.reconcile(Room, Topic, Message, archive_model=ArchivedMessage)
+        self.assertEqual(fixed, (1, 1))
+        self.assertCounts(1, 1)
+        self.rust.refresh_from_db()
+        self.assertEqual(self.rust.room_count, 0)
+        self.assertEqual(counters.reconcile(Room, Topic, Message, archive_model=ArchivedMessage), (0, 0))
+
+
+class MessagesSinceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.room = Room.objects.create(host=cls.user, name='Async')
+        Message.objects.create(user=cls.user, room=cls.room, body='hello')
+
+    def test_non_finite_wait_does_not_poll(self):
+        url = f'/room/{self.room.pk}/messages/'
+        cursor = self.client.get(url).json()['cursor']
+        for wait in ('nan', 'inf', '-inf', 'x'):
+            with self.subTest(wait=wait):
+                response = self.client.get(url, {'after': cursor, 'wait': wait})
+                self.assertEqual(response.json()['messages'], [])
+
+    @override_settings(LONG_POLL_TIMEOUT=0.1)
+    def test_wait_is_capped(self):
+        url = f'/room/{self.room.pk}/messages/'
+        cursor = self.client.get(url).json()['cursor']
+        response = self.client.get(url, {'after': cursor, 'wait': '1e9'})
+        self.assertEqual(response.json(), {'messages': [], 'cursor': cursor})
+
+    def test_resume_from_a_payload_cursor(self):
+        url = f'/room/{self.room.pk}/messages/'
+        Message.objects.create(user=self.user, room=self.room, body='second')
+        Message.objects.create(user=self.user, room=self.room, body='third')
+        first = self.client.get(url).json()['messages'][0]
+        response = self.client.get(url, {'after': first['cursor']})
+        self.assertEqual([message['body'] for message in response.json()['messages']], ['second', 'third'])
+
+    def test_event_ids_are_per_message(self):
+        Message.objects.create(user=self.user, room=self.room, body='second')
+        response = self.client.get(f'/room/{self.room.pk}/events/')
+        events = iter(response.streaming_content)
+        next(events)
+        for body in ('hello', 'second'):
+            event = next(events).decode()
+            payload = json.loads(event.split('data: ', 1)[1])
+            self.assertEqual((payload['body'], event.splitlines()[0]), (body, f'id: {payload["cursor"]}'))
+        response.close()
+
+    @override_settings(SSE_KEEPALIVE=0.1)
+    def test_event_stream_is_not_buffered_under_wsgi(self):
+        response = self.client.get(f'/room/{self.room.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertEqual(next(events), b'retry: 3000\n\n')
+        self.assertIn(b'"body": "hello"', next(events))
+        self.assertEqual(next(events), b': keepalive\n\n')
+        response.close()
+
+
+class BatchApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.rooms = [Room.objects.create(host=cls.user, name=f'Room {i}') for i in range(3)]
+
+    def test_rooms_in_requested_order(self):
+        first, second, _third = self.rooms
+        response = self.client.get('/api/rooms/batch/', {'ids': f'{second.pk},999,0{first.pk},x,{second.pk}'})
+        self.assertEqual(response.json()['results'], [
+            {'id': str(second.pk), 'room': mock.ANY},
+            {'id': '999', 'error': 'Room not found.'},
+            {'id': f'0{first.pk}', 'room': mock.ANY},
+            {'id': 'x', 'error': 'Room not found.'},
+        ])
+        self.assertEqual(response.json()['results'][2]['room']['name'], 'Room 0')
+
+    @override_settings(API_MAX_BATCH_SIZE=2)
+    def test_rooms_limits(self):
+        self.assertEqual(self.client.get('/api/rooms/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/rooms/batch/', {'ids': '1,2'}).status_code, 200)
+        self.assertEqual(self.client.get('/api/rooms/batch/', {'ids': '1,2,3'}).status_code, 400)
+
+    def post(self, messages):
+        return self.client.post('/api/messages/batch/', {'messages': messages}, content_type='application/json')
+
+    def test_post_needs_login(self):
+        self.assertIn(self.post([{'room': self.rooms[0].pk, 'body': 'hi'}]).status_code, (401, 403))
+        self.assertFalse(Message.objects.exists())
+
+    def test_post_results_and_side_effects(self):
+        self.client.force_login(self.user)
+        room = self.rooms[0]
+        version = fragments.version(fragments.MESSAGES)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([
+                {'room': room.pk, 'body': 'hello python'},
+                'not an object',
+                {'room': 999, 'body': 'lost'},
+                {'room': room.pk, 'body': '  '},
+                {'room': f'0{room.pk}', 'body': 'padded id'},
+            ])
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual(results[1:4], [
+            {'error': 'Each message must be an object.'},
+            {'error': 'Room not found.'},
+            {'error': 'Message body is required.'},
+        ])
+        created = [results[0]['id'], results[4]['id']]
+        self.assertEqual(sorted(Message.objects.values_list('pk', flat=True)), sorted(created))
+        room.refresh_from_db()
+        self.assertEqual((room.message_count, room.participant_count), (2, 1))
+        self.assertNotEqual(fragments.version(fragments.MESSAGES), version)
+        if search.get_backend(connection):
+            self.assertEqual(search.search_message_ids('python'), [results[0]['id']])
+
+    @override_settings(API_MAX_BATCH_SIZE=2)
+    def test_post_limits(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.post([]).status_code, 400)
+        item = {'room': self.rooms[0].pk, 'body': 'hi'}
+        self.assertEqual(self.post([item] * 3).status_code, 400)
+        self.assertEqual(self.post([{'room': 999, 'body': 'hi'}]).status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+
+@override_settings(ROOM_MESSAGE_WINDOW=3, SSE_KEEPALIVE=0.1)
+class LiveUpdateCursorTests(TestCase):
+    """The room page tells the live updates where to start, so messages it already shows are not sent again."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.room = Room.objects.create(host=cls.user, name='Busy')
+        for i in range(5):
+            Message.objects.create(user=cls.user, room=cls.room, body=f'message {i}')
+
+    def events(self, after):
+        response = self.client.get(f'/room/{self.room.pk}/events/', {'after': after})
+        events = iter(response.streaming_content)
+        next(events)  # retry
+        try:
+            return next(events)
+        finally:
+            response.close()
+
+    def test_stream_starts_after_the_page(self):
+        response = self.client.get(f'/room/{self.room.pk}/')
+        self.assertEqual(len(response.context['room_messages']), 3)
+        after = response.context['after']
+        self.assertContains(response, f'data-after="{after}"')
+        self.assertEqual(self.events(after), b': keepalive\n\n')
+        Message.objects.create(user=self.user, room=self.room, body='new')
+        event = self.events(after)
+        self.assertIn(b'"body": "new"', event)
+        self.assertNotIn(b'message 0', event)
+
+    def test_older_window_starts_after_the_newest_message(self):
+        first = self.client.get(f'/room/{self.room.pk}/')
+        older = self.client.get(f'/room/{self.room.pk}/', {'before': first.context['room_messages'].next_cursor})
+        self.assertNotIn('message 4', [message.body for message in older.context['room_messages']])
+        # Cursors are signed with a timestamp, so compare what they point at.
+        self.assertEqual(decode_cursor(older.context['after']), decode_cursor(first.context['after']))
+
+
+class RoomsApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        topic = Topic.objects.create(name='Python')
+        for i in range(7):
+            Room.objects.create(host=cls.user, topic=topic, name=f'Room {i}')
+        cls.order = list(Room.objects.order_by('-updated', '-created', '-pk').values_list('pk', flat=True))
+
+    def test_cursor_round_trip(self):
+        pages, url = [], '/api/rooms/?limit=3'
+        while url:
+            data = self.client.get(url).json()
+            pages.append(([room['id'] for room in data['results']], data['previous']))
+            url = data['next']
+        self.assertEqual([ids for ids, _previous in pages], [self.order[:3], self.order[3:6], self.order[6:]])
+        self.assertIsNone(pages[0][1])
+        # Going back from the last page gives the middle page again.
+        previous = self.client.get(pages[2][1]).json()
+        self.assertEqual([room['id'] for room in previous['results']], self.order[3:6])
+        self.assertIsNotNone(previous['next'])
+
+    def test_page_is_stable_under_inserts(self):
+        first = self.client.get('/api/rooms/?limit=3').json()
+        Room.objects.create(host=self.user, name='Newest')
+        second = self.client.get(first['next']).json()
+        self.assertEqual([room['id'] for room in second['results']], self.order[3:6])
+
+    def test_forged_cursor_starts_over(self):
+        data = self.client.get('/api/rooms/', {'limit': 3, 'cursor': 'not-a-cursor'}).json()
+        self.assertEqual([room['id'] for room in data['results']], self.order[:3])
+
+    def test_fields(self):
+        data = self.client.get('/api/rooms/', {'fields': 'id,name,nope'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+        room = self.client.get(f'/api/room/{self.order[0]}/', {'fields': 'name,participant_count'}).json()
+        self.assertEqual(set(room), {'name', 'participant_count'})
+        # Nothing known requested: every field.
+        data = self.client.get('/api/rooms/', {'fields': 'nope'}).json()
+        self.assertIn('participants', data['results'][0])
+
+    def test_unknown_room(self):
+        self.assertEqual(self.client.get('/api/room/abc/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/room/{max(self.order) + 1}/').status_code, 404)
+
+    def test_ndjson_streams_every_room(self):
+        response = self.client.get('/api/rooms/', {'format': 'ndjson', 'fields': 'id'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{'id': pk} for pk in self.order])
+
+
+class FragmentVersionTests(TestCase):
+    """Writes bump the versions of the fragments that show them, once committed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.topic = Topic.objects.create(name='Python')
+        cls.room = Room.objects.create(host=cls.user, topic=cls.topic, name='Async')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBumps(self, names, write):
+        before = fragments.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+            self.assertEqual(fragments.versions(), before, "bumped before commit")
+        after = fragments.versions()
+        self.assertEqual({name for name in fragments.NAMES if after[name] != before[name]}, set(names))
+
+    def test_room_changes(self):
+        def rename():
+            self.room.name = 'Sync'
+            self.room.save()
+        self.assertBumps({fragments.ROOMS, fragments.TOPICS, fragments.MESSAGES}, rename)
+        self.assertBumps({fragments.ROOMS, fragments.TOPICS, fragments.MESSAGES}, self.room.delete)
+
+    def test_participants(self):
+        self.assertBumps({fragments.ROOMS}, lambda: self.room.participants.add(self.user))
+
+    def test_messages(self):
+        message = Message(user=self.user, room=self.room, body='hello')
+        self.assertBumps({fragments.MESSAGES}, message.save)
+        self.assertBumps({fragments.MESSAGES}, message.delete)
+
+    def test_posting_in_bulk(self):
+        self.assertBumps(
+            {fragments.MESSAGES, fragments.ROOMS}, lambda: post_messages([(self.user, self.room, 'hello')]),
+        )
+
+    def test_topics(self):
+        def rename():
+            self.topic.name = 'Rust'
+            self.topic.save()
+        self.assertBumps({fragments.TOPICS, fragments.ROOMS}, rename)
+
+    def test_users(self):
+        def rename():
+            self.user.username = 'alice'
+            self.user.save()
+        self.assertBumps({fragments.USERS}, rename)
+        self.assertBumps(set(), lambda: self.user.save(update_fields=['last_login']))
+
+    def test_cached_feed_follows_renames(self):
+        self.assertContains(self.client.get('/'), 'Async')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.name = 'Renamed room'
+            self.room.save()
+        self.assertContains(self.client.get('/'), 'Renamed room')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.room = Room.objects.create(host=cls.user, name='Async')
+        Message.objects.create(user=cls.user, room=cls.room, body='hello')
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/room/{self.room.pk}/'
+
+    def revalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        return self.client.get(self.url, headers={'If-None-Match': etag})
+
+    def test_repeat_visit_is_not_modified(self):
+        # The first response sets the CSRF cookie; that must not change the tag.
+        self.assertEqual(self.revalidate().status_code, 304)
+        self.client.force_login(self.user)
+        self.assertEqual(self.revalidate().status_code, 304)
+
+    def test_new_message_changes_the_page(self):
+        etag = self.client.get(self.url)['ETag']
+        Message.objects.create(user=self.user, room=self.room, body='again')
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_renamed_author_changes_the_page(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = 'alice'
+            self.user.save()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '@alice')
+
+    def assertChangesThePage(self, change):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_renamed_topic_changes_the_page(self):
+        topic = Topic.objects.create(name='Python')
+        Room.objects.filter(pk=self.room.pk).update(topic=topic)
+
+        def rename():
+            topic.name = 'Rust'
+            topic.save()
+        self.assertContains(self.assertChangesThePage(rename), 'Rust')
+
+    @override_settings(MODERATION_ACTION='hide')
+    @mock.patch('base.moderation.close_old_connections', lambda: None)
+    @mock.patch('base.moderation.contains_profanity', lambda body: True)
+    def test_hidden_archived_message_changes_the_page(self):
+        message = Message.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive(before=timezone.now() + timedelta(days=1))
+        self.assertContains(self.client.get(self.url), 'hello')
+        response = self.assertChangesThePage(lambda: moderation.moderate_batch([(message.pk, self.room.pk, 'hello')]))
+        self.assertNotContains(response, 'hello')
+
+    def test_api_room(self):
+        url = f'/api/room/{self.room.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_api_rooms_vary_on_accept(self):
+        response = self.client.get('/api/rooms/')
+        self.assertIn('Cache-Control', response)
+        self.assertIn('Accept', response['Vary'])
+
+
+class SharedCacheTests(TestCase):
+    def test_catalogue_follows_topic_writes(self):
+        cache.clear()
+        self.assertEqual(catalogue.all_topics(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            topic, created = catalogue.get_or_create_topic('Python')
+        self.assertTrue(created)
+        self.assertEqual(catalogue.all_topics(), [topic])
+        self.assertEqual(catalogue.get_or_create_topic('Python'), (topic, False))
+
+    def test_catalogue_reads_are_counted_in_the_metrics(self):
+        def reads():
+            series = metrics.registry.snapshot()['topic_catalogue_reads_total']
+            return {tier: series.get(json.dumps([tier]), 0) for tier in ('local', 'shared', 'database')}
+
+        cache.clear()
+        before = reads()
+        catalogue.all_topics()
+        catalogue.all_topics()
+        with mock.patch('base.catalogue._local', None):  # as in a process that has not read it yet
+            catalogue.all_topics()
+        after = reads()
+        self.assertEqual({tier: after[tier] - before[tier] for tier in after}, {'local': 1, 'shared': 1, 'database': 1})
+        self.assertContains(
+            self.client.get('/metrics/'),
+            f'studybuddy_topic_catalogue_reads_total{{tier="database"}} {after["database"]}',
+        )
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['base.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/1'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def new_session(self):
+        store = SessionStore()
+        store['cart'] = [1, 2]
+        store.save(must_create=True)
+        return store.session_key
+
+    def test_unchanged_session_is_not_saved(self):
+        store = SessionStore(self.new_session())
+        store['cart'] = [1, 2]
+        with self.assertNumQueries(0):
+            store.save()
+        store['cart'] = [3]
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertTrue(queries)
+        self.assertEqual(SessionStore(store.session_key).load(), {'cart': [3]})
+
+    def test_process_local_cache_is_not_used(self):
+        key = self.new_session()
+        self.assertIsNone(cache.get(SessionStore(key).cache_key))
+        # Logged out by another worker: gone here too.
+        Session.objects.filter(session_key=key).delete()
+        self.assertEqual(SessionStore(key).load(), {})
+        self.assertFalse(SessionStore().exists(key))
+
+    def test_shared_cache_serves_reads(self):
+        with mock.patch('base.sessions.is_shared_cache', return_value=True):
+            key = self.new_session()
+            with self.assertNumQueries(0):
+                self.assertEqual(SessionStore(key).load(), {'cart': [1, 2]})
+            SessionStore(key).delete()
+            self.assertIsNone(cache.get(SessionStore(key).cache_key))
+            self.assertEqual(SessionStore(key).load(), {})
+
+    def test_clear_expired_in_batches(self):
+        live = self.new_session()
+        for _ in range(5):
+            self.new_session()
+        Session.objects.exclude(session_key=live).update(expire_date=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(SessionStore.clear_expired(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live])
+
+
+@override_settings(AUTH_THROTTLE={'email': (2, 60), 'ip': (3, 60)}, PASSWORD_HASH_WORKERS=0)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_email_limit(self):
+        hashing.throttle(None, 'al@example.com')
+        hashing.throttle(None, 'AL@example.com')
+        with self.assertRaises(hashing.Throttled):
+            hashing.throttle(None, 'al@example.com')
+        hashing.reset_throttle(None, 'al@example.com')
+        hashing.throttle(None, 'al@example.com')
+
+    def test_login_view(self):
+        User.objects.create_user(email='al@example.com', password='pw')
+        statuses = [
+            self.client.post('/login/', {'email': f'user{i}@example.com', 'password': 'wrong'}).status_code
+            for i in range(4)
+        ]
+        # Different emails, one client IP: the IP limit applies.
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A second SQLite file stands in for the replica. It is a copy of the
+    primary taken before each test, so a room created afterwards only
+    exists on the primary and a read shows where it was routed.
+    """
+
+    # Added after the class is set up, so it is neither in `databases` nor blocked.
+    REPLICA = 'replica_test'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tempdir = tempfile.TemporaryDirectory()
+        replica = {**connections['default'].settings_dict, 'NAME': os.path.join(cls.tempdir.name, 'replica.sqlite3')}
+        # connections reads its aliases from this same dict.
+        cls.enterClassContext(mock.patch.dict(settings.DATABASES, {cls.REPLICA: replica}))
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.REPLICA].close()
+        del connections[cls.REPLICA]
+        cls.tempdir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='al@example.com', password='pw')
+        self.replicated = Room.objects.create(host=self.user, name='Replicated')
+        primary, replica = connections['default'], connections[self.REPLICA]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        self.room = Room.objects.create(host=self.user, name='Primary only')
+
+    def on_primary(self):
+        return Room.objects.filter(pk=self.room.pk).exists()
+
+    def test_reads_go_to_the_replica(self):
+        self.assertFalse(self.on_primary())
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertEqual(Room.objects.all().db, self.REPLICA)
+
+    def test_writes_go_to_the_primary(self):
+        self.room.name = 'Renamed'
+        self.room.save()
+        self.assertEqual(Room.objects.using('default').get(pk=self.room.pk).name, 'Renamed')
+
+    def test_pinned_reads_go_to_the_primary(self):
+        with pin_primary():
+            self.assertTrue(self.on_primary())
+            with pin_primary(False):
+                self.assertFalse(self.on_primary())
+            self.assertTrue(self.on_primary())
+        with transaction.atomic():
+            self.assertTrue(self.on_primary())
+
+    def test_reads_after_a_post_stick_to_the_primary(self):
+        url = f'/api/room/{self.room.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.post('/login/', {'email': 'al@example.com', 'password': 'wrong'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(SSE_KEEPALIVE=0.1)
+    def test_live_updates_read_the_primary(self):
+        # Streams outlive the middleware's pin and chase writes that just committed.
+        Message.objects.create(user=self.user, room=self.replicated, body='just posted')
+        url = f'/room/{self.replicated.pk}/messages/'
+        self.assertEqual(self.client.get(url).json()['messages'], [])
+        self.assertEqual(len(self.client.get(url, {'wait': 0.1}).json()['messages']), 1)
+        response = self.client.get(f'/room/{self.replicated.pk}/events/')
+        events = iter(response.streaming_content)
+        next(events)
+        self.assertIn(b'just posted', next(events))
+        response.close()
+
+    async def test_middleware_runs_async(self):
+        async def view(request):
+            return HttpResponse(str(is_pinned()))
+
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = RequestFactory()
+        self.assertEqual((await middleware(factory.get('/'))).content, b'False')
+        response = await middleware(factory.post('/'))
+        self.assertEqual(response.content, b'True')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        factory.cookies[STICKY_COOKIE] = '1'
+        self.assertEqual((await middleware(factory.get('/'))).content, b'True')
+
+
+@override_settings(ACTIVITY_FEED_SIZE=2)
+class ActivityFeedTests(TestCase):
+    """The activity panels show one page and link to the activity page, which pages through the rest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.al = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        cls.bo = User.objects.create_user(email='bo@example.com', password='pw', username='bo')
+        room = Room.objects.create(host=cls.al, name='Room')
+        for i in range(3):
+            post_message(cls.al, room, f'al {i}')
+        post_message(cls.bo, room, 'bo 0')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.al)
+
+    def walk(self, url):
+        bodies = []
+        while url:
+            response = self.client.get(url)
+            page = response.context['room_messages']
+            self.assertLessEqual(len(page), 2)
+            bodies += [message.body for message in page]
+            url = response.context['next_url']
+        return bodies
+
+    def test_panels_link_to_the_rest(self):
+        self.assertContains(self.client.get('/'), 'href="/activityPage/">More activity')
+        profile = self.client.get(f'/user-profile/{self.al.pk}/')
+        self.assertContains(profile, f'href="/activityPage/?user={self.al.pk}">More activity')
+        self.assertNotContains(self.client.get(f'/user-profile/{self.bo.pk}/'), 'More activity')
+
+    def test_activity_page(self):
+        self.assertEqual(self.walk('/activityPage/'), ['bo 0', 'al 2', 'al 1', 'al 0'])
+        self.assertEqual(self.walk(f'/activityPage/?user={self.al.pk}'), ['al 2', 'al 1', 'al 0'])
+        self.assertEqual(self.client.get('/activityPage/?user=nope').status_code, 404)
+
+
+class ArchivedMessageTests(TransactionTestCase):
+    """Archived messages can still be deleted and moderated. Transactional: moderation runs in worker threads."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='al@example.com', password='pw')
+        self.room = Room.objects.create(host=self.user, name='Room')
+        for body in ('old and fine', 'old and bad', 'new and bad'):
+            post_message(self.user, self.room, body)
+        Message.objects.filter(body__startswith='old').update(created=timezone.now() - timedelta(days=365))
+        self.assertEqual(archive.archive(), 2)
+
+    def test_delete(self):
+        message = ArchivedMessage.objects.get(body='old and fine')
+        self.client.force_login(self.user)
+        response = self.client.post(f'/delete-message/{message.pk}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ArchivedMessage.objects.filter(pk=message.pk).exists())
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 2)
+
+    @override_settings(MODERATION_ACTION='hide')
+    @mock.patch('base.moderation.contains_profanity', lambda body: 'bad' in body)
+    def test_moderation(self):
+        self.assertEqual(moderation.metrics()['pending'], 3)
+        pool = moderation.ModerationPool(workers=1, batch_size=2)
+        try:
+            self.assertEqual(pool.run_round(), 2)
+            self.assertEqual(pool.run_round(), 1)
+        finally:
+            pool.stop()
+        self.assertEqual(moderation.metrics()['pending'], 0)
+        statuses = dict(ArchivedMessage.objects.values_list('body', 'moderation_status'))
+        self.assertEqual(statuses, {'old and fine': Message.APPROVED, 'old and bad': Message.HIDDEN})
+        self.assertEqual(Message.objects.get().moderation_status, Message.HIDDEN)
+
+
+class LoaderTests(TransactionTestCase):
+    """import_dump streams a dumpdata file into the current schema. Transactional: batches load in worker threads."""
+
+    DUMP = [
+        {'model': 'auth.user', 'pk': 1, 'fields': {
+            'username': 'al', 'email': '', 'password': '!', 'groups': [], 'date_joined': '2021-03-01T10:00:00Z',
+        }},
+        {'model': 'auth.user', 'pk': 2, 'fields': {
+            'username': 'b\u00f8', 'email': 'bo@example.com', 'password': '!', 'date_joined': '2021-03-01T10:00:00Z',
+        }},
+        {'model': 'base.topic', 'pk': 1, 'fields': {'name': 'Python'}},
+        {'model': 'base.room', 'pk': 7, 'fields': {
+            'host': 1, 'topic': 1, 'name': 'Async views', 'description': 'Brackets ] and, commas [',
+            'participants': [1, 2], 'update': '2021-03-02T10:00:00Z', 'created': '2021-03-01T10:00:00Z',
+        }},
+        {'model': 'base.message', 'pk': 3, 'fields': {
+            'user': 1, 'room': 7, 'body': 'Tracebacks in the "worker"', 'update': '2021-03-02T10:00:00Z',
+            'created': '2021-03-02T10:00:00Z',
+        }},
+        {'model': 'base.message', 'pk': 4, 'fields': {
+            'user': 2, 'room': 7, 'body': 'Z\u00fcrich \U0001f40d', 'updated': '2021-03-03T10:00:00Z',
+            'created': '2021-03-03T10:00:00Z',
+        }},
+        {'model': 'sessions.session', 'pk': 'abc', 'fields': {'session_data': 'x', 'expire_date': '2021-04-01T00:00:00Z'}},
+    ]
+
+    def write_dump(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(self.DUMP, fp, indent=2, ensure_ascii=False)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_iter_objects_across_chunk_boundaries(self):
+        items = self.DUMP + [12345, -1.5e3, 'tail ]', None, [1, [2]], True]
+        text = json.dumps(items, ensure_ascii=False)
+        for chunk_size in range(1, 40):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(loader.iter_objects(io.StringIO(text), chunk_size)), items)
+        self.assertEqual(list(loader.iter_objects(io.StringIO('[]'), 1)), [])
+        with self.assertRaises(json.JSONDecodeError):
+            list(loader.iter_objects(io.StringIO('[{"model": "base.topic"'), 4))
+
+    def assertImported(self, skipped):
+        self.assertEqual(skipped, {'sessions.session': 1})
+        al = User.objects.get(pk=loader.user_pk(1))
+        self.assertEqual((al.username, al.email), ('al', f'{al.pk}@import.invalid'))
+        self.assertEqual(User.objects.get(pk=loader.user_pk(2)).username, 'b\u00f8')
+        self.assertEqual(
+            (User.objects.count(), Topic.objects.count(), Room.objects.count(), Message.objects.count()), (2, 1, 1, 2),
+        )
+        room = Room.objects.get()
+        self.assertEqual(room.description, 'Brackets ] and, commas [')
+        self.assertEqual(room.updated.isoformat(), '2021-03-02T10:00:00+00:00')
+        self.assertEqual((room.message_count, room.participant_count), (2, 2))
+        self.assertEqual(Topic.objects.get().room_count, 1)
+        self.assertEqual(Message.objects.get(pk=4).body, 'Z\u00fcrich \U0001f40d')
+        if search.get_backend(connection):
+            self.assertEqual(search.search_message_ids('traceback'), [3])
+            self.assertEqual(search.search_room_ids('python'), [7])
+
+    def test_load(self):
+        path = self.write_dump()
+        iter_objects = loader.iter_objects
+        # Small chunks, so strings, numbers and escapes get split between reads.
+        with mock.patch.object(loader, 'iter_objects', lambda fp: iter_objects(fp, chunk_size=5)):
+            self.assertImported(loader.load(path, batch_size=1))
+
+    def test_parallel_load(self):
+        self.assertImported(loader.load(self.write_dump(), batch_size=1, workers=2))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('import_dump', self.write_dump(), '--batch-size=2', stdout=out)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertIn('sessions.session', out.getvalue())
+
+
+class MetricsTests(TestCase):
+    def requests_total(self):
+        return sum(metrics.registry.snapshot()['http_requests_total'].values())
+
+    async def test_middleware_runs_async(self):
+        async def view(request):
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        before = self.requests_total()
+        self.assertEqual((await middleware(RequestFactory().get('/'))).content, b'ok')
+        self.assertEqual(self.requests_total(), before + 1)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='203.0.113.1').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_set(self):
+        # Behind a local reverse proxy every client would pass the IP check.
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        self.assertEqual(self.client.get('/metrics/', headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.1', headers={'Authorization': 'Bearer secret'})
+        self.assertContains(response, 'studybuddy_http_requests_total')
+
+
+@override_settings(SQLITE_WRITE_QUEUE=False)
+class WebSocketTests(TransactionTestCase):
+    """
+    The endpoint driven through raw ASGI receive/send queues. Transactional,
+    so messages are published by the real on-commit path of the in-process
+    broker.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        self.room = Room.objects.create(host=self.user, name='Live')
+        self.client.force_login(self.user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    async def connect(self, path=None, cookie=True, origin='http://testserver'):
+        headers = [(b'host', b'testserver')]
+        if cookie:
+            headers.append((b'cookie', self.cookie.encode()))
+        if origin:
+            headers.append((b'origin', origin.encode()))
+        scope = {'type': 'websocket', 'path': path or f'/ws/room/{self.room.pk}/', 'headers': headers}
+        self.inbox, self.outbox = asyncio.Queue(), asyncio.Queue()
+        await self.inbox.put({'type': 'websocket.connect'})
+        self.app = asyncio.ensure_future(websocket_application(scope, self.inbox.get, self.outbox.put))
+        return await self.next_event()
+
+    async def next_event(self):
+        return await asyncio.wait_for(self.outbox.get(), 5)
+
+    async def next_frame(self):
+        return json.loads((await self.next_event())['text'])
+
+    async def send(self, body):
+        await self.inbox.put({'type': 'websocket.receive', 'text': json.dumps({'body': body})})
+
+    async def disconnect(self):
+        await self.inbox.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(self.app, 5)
+
+    async def test_unknown_room(self):
+        event = await self.connect(path='/ws/room/999/')
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+
+    async def test_post_and_receive(self):
+        self.assertEqual((await self.connect())['type'], 'websocket.accept')
+        await self.send('hello')
+        frame = await self.next_frame()
+        self.assertEqual((frame['type'], frame['body'], frame['user']['username']), ('message', 'hello', 'al'))
+        self.assertTrue(frame['cursor'])
+        # Posts from elsewhere arrive too, once committed.
+        message = await sync_to_async(post_message)(self.user, self.room, 'from the form')
+        pk = message.pk
+        self.assertEqual((await self.next_frame())['id'], pk)
+        await sync_to_async(message.delete)()
+        self.assertEqual(await self.next_frame(), {'type': 'message.deleted', 'id': pk, 'room': self.room.pk})
+        await self.disconnect()
+        self.assertEqual(await Message.objects.filter(room=self.room).acount(), 1)
+
+    async def test_posting_needs_login_and_same_origin(self):
+        for kwargs in ({'cookie': False}, {'origin': 'http://evil.example'}):
+            with self.subTest(**kwargs):
+                self.assertEqual((await self.connect(**kwargs))['type'], 'websocket.accept')
+                await self.send('spam')
+                self.assertEqual(await self.next_frame(), {'type': 'error', 'error': 'login required'})
+                await self.disconnect()
+        self.assertFalse(await Message.objects.aexists())
+
+
+class AvatarTests(TestCase):
+    """Uploading an avatar builds content-hashed thumbnails that the ``avatar`` filter and pages pick up."""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        # Build thumbnails inline instead of in the worker pool.
+        self.enterContext(mock.patch('base.avatars.get_executor', lambda: mock.Mock(submit=lambda fn, *args: fn(*args))))
+        self.enterContext(mock.patch('base.avatars.close_old_connections', lambda: None))
+        self.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        self.client.force_login(self.user)
+
+    def upload(self, color, size=(300, 200)):
+        image = io.BytesIO()
+        Image.new('RGB', size, color).save(image, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/update-user/{self.user.pk}/', {
+                'avatar': SimpleUploadedFile('me.png', image.getvalue(), content_type='image/png'),
+                'email': self.user.email, 'username': 'al',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        return self.user.avatar_hash
+
+    def render(self, user, size):
+        return Template('{% load avatars %}{{ user|avatar:size }}').render(Context({'user': user, 'size': size}, autoescape=False))
+
+    def test_thumbnails(self):
+        content_hash = self.upload('red')
+        self.assertTrue(content_hash)
+        for size, pixels in avatars.SIZES.items():
+            for fmt in avatars.FORMATS:
+                with default_storage.open(avatars.variant_name(content_hash, size, fmt)) as variant:
+                    self.assertEqual(Image.open(variant).size, (pixels, pixels))
+        self.assertEqual(self.render(self.user, 'small'), f'/images/avatars/{content_hash}/small.webp')
+        self.assertEqual(self.render(self.user, 'large.jpg'), f'/images/avatars/{content_hash}/large.jpg')
+
+    def test_filter_fallback(self):
+        self.assertEqual(self.render(self.user, 'small'), default_avatar_url())
+        self.assertEqual(self.render(None, 'small'), '')
+        with mock.patch('base.avatars.process_avatar'):
+            self.assertEqual(self.upload('red'), '')
+        # No thumbnails yet: the uploaded file itself, not the cached default.
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(self.render(user, 'small'), user.avatar.url)
+        self.assertEqual(self.render(user, 'huge'), user.avatar.url)
+
+    def test_avatar_url_follows_saves(self):
+        self.assertEqual(self.user.avatar_url, default_avatar_url())
+        with mock.patch('base.avatars.process_avatar'):
+            self.upload('red')
+        # Both the cached URL and the one memoized on the reloaded instance are dropped.
+        self.assertEqual(self.user.avatar_url, '/images/avatars/me.png')
+        self.assertEqual(User.objects.get(pk=self.user.pk).avatar_url, '/images/avatars/me.png')
+        self.user.avatar = None
+        self.user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).avatar_url, default_avatar_url())
+
+    def test_profile_update_changes_the_rendered_url(self):
+        profile = f'/user-profile/{self.user.pk}/'
+        first = self.upload('red')
+        self.assertContains(self.client.get(profile), f'/images/avatars/{first}/large.webp')
+        second = self.upload('blue')
+        self.assertNotEqual(first, second)
+        response = self.client.get(profile)
+        self.assertContains(response, f'/images/avatars/{second}/large.webp')
+        self.assertNotContains(response, first)
+
+
+class ProfanityTests(SimpleTestCase):
+    """The compiled matcher agrees with better_profanity on single words."""
+
+    def test_parity_with_better_profanity(self):
+        words = sorted({word.lower() for word in read_wordlist(get_complete_path_of_file('profanity_wordlist.txt'))})
+        sample = [word for word in words[::5] if all(char in ALLOWED_CHARACTERS for char in word)]
+        self.assertGreater(len(sample), 100)
+        for word in sample:
+            for text in (word, f'You {word.upper()} there', f'{word}_head', f'Re: "{word}"!', f'x{word}', f'{word}s'):
+                with self.subTest(text=text):
+                    self.assertEqual(contains_profanity(text), profanity.contains_profanity(text))
+
+    def test_word_boundaries(self):
+        self.assertTrue(contains_profanity('shit_head'))
+        self.assertTrue(contains_profanity('what the 5h1t'))
+        self.assertFalse(contains_profanity('Scunthorpe and assessments'))
+        self.assertFalse(contains_profanity(''))
+
+
+class WriteQueueTests(SimpleTestCase):
+    def test_timed_out_items_are_not_written(self):
+        release, seen = threading.Event(), []
+
+        def handler(items):
+            seen.append(items)
+            release.wait(5)
+            return items
+
+        write_queue = WriteQueue(handler, timeout=0.1)
+        first = threading.Thread(target=write_queue.submit, args=('a',))
+        first.start()
+        while not seen:
+            release.wait(0.01)
+        # 'b' is still queued behind the commit of 'a' when its wait runs out.
+        with self.assertRaises(WriteTimeout):
+            write_queue.submit('b')
+        release.set()
+        first.join()
+        self.assertEqual(write_queue.submit('c'), 'c')
+        self.assertEqual(seen, [['a'], ['c']])
+
+
+class PostMessageViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='al@example.com', password='pw')
+        self.room = Room.objects.create(host=self.user, name='Room')
+        self.client.force_login(self.user)
+        self.url = f'/room/{self.room.pk}/'
+
+    def test_empty_message_is_rejected(self):
+        for data in ({}, {'message_body': '  '}):
+            self.assertEqual(self.client.post(self.url, data).status_code, 400)
+        self.assertFalse(Message.objects.exists())
+        with self.assertRaises(ValueError):
+            post_message(self.user, self.room, '')
+
+    def test_write_timeout(self):
+        with mock.patch('base.views.post_message', side_effect=WriteTimeout):
+            response = self.client.post(self.url, {'message_body': 'Hello'})
+        self.assertEqual(response.status_code, 503)
+        self.assertContains(response, 'Please send it again', status_code=503)
+
+
+class FakeRedis:
+    """
+    Stand-in for one Redis server's pub/sub, with the parts of the redis-py
+    sync and asyncio clients RedisBroker uses. Payloads come back as bytes,
+    as from a real server.
+    """
+
+    def __init__(self):
+        self.channels = {}
+
+    def publish(self, channel, data):
+        receivers = list(self.channels.get(channel, ()))
+        for pubsub in receivers:
+            pubsub.messages.put_nowait({'type': 'message', 'channel': channel.encode(), 'data': data.encode()})
+        return len(receivers)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.server.channels.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel):
+        self.server.channels.get(channel, set()).discard(self)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisBrokerTests(SimpleTestCase):
+    """Two brokers on one server stand for two worker processes."""
+
+    def setUp(self):
+        self.server = FakeRedis()
+        self.workers = [RedisBroker(client=self.server, async_client=self.server) for _ in range(2)]
+
+    async def receive(self, subscription):
+        return await asyncio.wait_for(subscription.get(), 1)
+
+    async def stop(self, *subscriptions):
+        for subscription in subscriptions:
+            subscription.close()
+        await asyncio.sleep(0)  # Let the queued UNSUBSCRIBE run.
+        for broker in self.workers:
+            if broker._listener is not None:
+                await asyncio.wait_for(broker._listener, 2)
+
+    async def test_publish_reaches_other_workers(self):
+        first, second = self.workers
+        subscription = await first.subscribe('room.1')
+        second.publish('room.1', {'type': 'message', 'id': 7})
+        self.assertEqual(await self.receive(subscription), {'type': 'message', 'id': 7})
+        first.publish('room.1', {'type': 'message', 'id': 8})
+        self.assertEqual(await self.receive(subscription), {'type': 'message', 'id': 8})
+        await self.stop(subscription)
+
+    async def test_channels_are_separate_and_prefixed(self):
+        first, second = self.workers
+        subscription = await first.subscribe('room.1')
+        self.assertEqual(set(self.server.channels), {'whispersphere:room.1'})
+        second.publish('room.2', {'id': 1})
+        second.publish('room.1', {'id': 2})
+        self.assertEqual(await self.receive(subscription), {'id': 2})
+        await self.stop(subscription)
+
+    async def test_one_server_subscription_per_channel(self):
+        first, _second = self.workers
+        subscriptions = [await first.subscribe('room.1') for _ in range(3)]
+        self.assertEqual(len(self.server.channels['whispersphere:room.1']), 1)
+        self.assertEqual(self.server.publish('whispersphere:room.1', '{"id": 3}'), 1)
+        for subscription in subscriptions:
+            self.assertEqual(await self.receive(subscription), {'id': 3})
+        subscriptions[0].close()
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.server.channels['whispersphere:room.1']), 1)
+        await self.stop(*subscriptions[1:])
+        self.assertEqual(self.server.channels['whispersphere:room.1'], set())
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    """
+    Run each page and EXPLAIN every SELECT it sends. A plan step that scans
+    a whole table without an index means an access path lost its index.
+    """
+
+    # Read in full on purpose: the topic catalogue (base/catalogue.py).
+    FULL_READS = {'base_topic'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='al@example.com', password='pw', username='al')
+        other = User.objects.create_user(email='bo@example.com', password='pw', username='bo')
+        topics = [Topic.objects.create(name=name) for name in ('Python', 'Rust', 'Design')]
+        cls.rooms = [
+            Room.objects.create(host=(cls.user, other)[i % 2], topic=topics[i % 3], name=f'Room {i}')
+            for i in range(12)
+        ]
+        for i in range(40):
+            Message.objects.create(user=(cls.user, other)[i % 2], room=cls.rooms[i % 4], body=f'hello {i}')
+
+    def setUp(self):
+        # Cached fragments and catalogues would hide the queries under test.
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def plans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400, url)
+        return [
+            (query['sql'], self.explain(query['sql']))
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+
+    def assertIndexed(self, url, method='get', data=None):
+        for sql, plan in self.plans(method, url, data):
+            scans = [
+                step for step in plan
+                if step.startswith('SCAN ')
+                and ' USING ' not in step
+                and 'VIRTUAL TABLE' not in step
+                and step.split()[1] not in self.FULL_READS
+            ]
+            self.assertFalse(scans, f"{method.upper()} {url} scans a table:\n{sql}\n{plan}")
+
+    def test_index(self):
+        self.assertIndexed('/')
+
+    def test_index_search(self):
+        self.assertIndexed('/?q=python')
+
+    def test_room(self):
+        self.assertIndexed(f'/room/{self.rooms[0].pk}/')
+
+    def test_room_history(self):
+        self.assertIndexed(f'/room/{self.rooms[0].pk}/history/')
+
+    def test_user_profile(self):
+        self.assertIndexed(f'/user-profile/{self.user.pk}/')
+
+    def test_activity_page(self):
+        self.assertIndexed('/activityPage/')
+
+    def test_topic_page(self):
+        self.assertIndexed('/topicPage/?q=py')
+
+    def test_create_room_name_check(self):
+        self.assertIndexed('/create-room/', 'post', {'topic': 'Python', 'name': 'Room 1'})
+
+    def test_api_rooms(self):
+        self.assertIndexed('/api/rooms/')
+
+    def test_api_room(self):
+        self.assertIndexed(f'/api/room/{self.rooms[0].pk}/')
+
+    def test_room_feed_needs_no_sort(self):
+        # The keyset order (-updated, -created, -pk) is read straight off the index.
+        for url in ('/', '/api/rooms/'):
+            for sql, plan in self.plans('get', url):
+                if 'FROM "base_room"' in sql and 'ORDER BY' in sql:
+                    self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], f"{url} sorts rooms:\n{plan}")
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every benchmarked view stays within its query budget on a small
+    synthetic dataset. Query counts do not depend on the dataset size, so an
+    N+1 fails here; times and memory are left to ``manage.py benchmark``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.generate(users=40, rooms=30, messages=600, topics=10, batch_size=200)
+
+    def test_query_budgets(self):
+        report = benchmarks.run(timing=False)
+        for name, row in report['views'].items():
+            with self.subTest(view=name):
+                self.assertLess(row['status'], 400)
+                self.assertLessEqual(row['queries'], row['budget']['queries'])
@@ -8,6 +8,9 @@ urlpatterns = [
     path('register/',views.register_user,name="register"),
    
     path('room/<str:pk>/',views.room, name="room"),
+    path('room/<str:pk>/history/',views.room_history, name="room-history"),
+    path('room/<str:pk>/messages/',views.room_messages_since, name="room-messages-since"),
+    path('room/<str:pk>/events/',views.room_events, name="room-events"),
     path('user-profile/<str:pk>/', views.user_profile , name="user-profile"),
     path('update-user/<str:pk>/',views.update_user, name="update_user"),
     path('setting/',views.setting, name="setting"),
@@ -21,4 +24,7 @@ urlpatterns = [
     path('topicPage/',views.topic_page, name="topic-page"),
    
     path('back/',views.back,name='back'),
+
+    path('moderation/metrics/',views.moderation_metrics, name="moderation-metrics"),
+    path('metrics/',views.prometheus_metrics, name="metrics"),
 ]
@@ -1,26 +1,91 @@
 # utils.py
 
+import functools
 import re
-from better_profanity import profanity
+
+from better_profanity.constants import ALLOWED_CHARACTERS
+from better_profanity.utils import get_complete_path_of_file, read_wordlist
+
+NAME_RE = re.compile(r'^[a-zA-Z0-9\s-]+$')
+MEANINGLESS_RE = re.compile('|'.join(['asdf', 'qwerty', 'zxcv', 'hjkl']), re.IGNORECASE)
+
+# Same look-alike substitutions better_profanity checks for ("@ss", "5h1t", ...).
+CHARS_MAPPING = {
+    'a': 'a@*4',
+    'i': 'i*l1',
+    'o': 'o*0@',
+    'u': 'u*v',
+    'v': 'v*u',
+    'l': 'l1',
+    'e': 'e*3',
+    's': 's$5',
+    't': 't7',
+}
+# better_profanity's word characters (letters, digits and @$*"'); anything
+# else, including '_', separates words.
+WORD_CHARS = ''.join(re.escape(char) for char in sorted(ALLOWED_CHARACTERS))
+
+
+def _char_pattern(char):
+    return '[%s]' % re.escape(CHARS_MAPPING[char]) if char in CHARS_MAPPING else re.escape(char)
+
+
+def _trie_pattern(node):
+    branches = [char + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if '' in node:
+        return '(?:%s)?' % '|'.join(branches)
+    return branches[0] if len(branches) == 1 else '(?:%s)' % '|'.join(branches)
+
+
+@functools.lru_cache(maxsize=None)
+def profanity_pattern():
+    """
+    Compile better_profanity's wordlist, with its look-alike variants, into a
+    single regex matching whole words only. Built once per process.
+
+    Words are split the way better_profanity splits them, so "shit_head" is
+    flagged. Unlike the library, separate words are not joined up to form a
+    listed word ("a ss", "blow jobs"), and entries containing separators
+    ("blow job", "s.o.b.") match exactly as listed.
+    """
+    # A trie of the words, so the regex engine tries one branch per prefix
+    # instead of every word at every position.
+    trie = {}
+    for word in read_wordlist(get_complete_path_of_file('profanity_wordlist.txt')):
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(_char_pattern(char), {})
+        node[''] = {}
+    return re.compile(f'(?<![{WORD_CHARS}])(?:{_trie_pattern(trie)})(?![{WORD_CHARS}])', re.IGNORECASE)
+
+
+def contains_profanity(text):
+    """Check if the text contains a word from the profanity wordlist."""
+    return bool(text) and profanity_pattern().search(text) is not None
+
 
 def is_valid_name(name):
     """Check if the name contains only alphanumeric characters, spaces, and hyphens."""
-    return bool(re.match(r'^[a-zA-Z0-9\s-]+$', name))
+    return bool(NAME_RE.match(name or ''))
+
 
 def is_meaningful(name):
     """Check if the name is not in a list of meaningless words."""
-    meaningless_words = ['asdf', 'qwerty', 'zxcv', 'hjkl']
-    return not any(word in name.lower() for word in meaningless_words)
+    return not MEANINGLESS_RE.search(name or '')
 
+
+@functools.lru_cache(maxsize=4096)
 def validate_name(name, check_profanity=True):
     """Validate a name for valid characters, meaningfulness, and optionally profanity."""
     if not is_valid_name(name):
         return False, "Name should only contain alphanumeric characters, spaces, and hyphens."
-    
+
     if not is_meaningful(name):
         return False, "Please use a meaningful name."
-    
-    if check_profanity and profanity.contains_profanity(name):
+
+    if check_profanity and contains_profanity(name):
         return False, "Name contains inappropriate language."
-    
-    return True, ""
\ No newline at end of file
+
+    return True, ""
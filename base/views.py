@@ -1,75 +1,126 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse, Http404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.db import transaction, IntegrityError
 from django.db.models import Q
-from django.core.paginator import Paginator
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.cache import cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext_lazy as _
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
 
-from .models import Room, Topic, Message, User
+from .models import ArchivedMessage, Room, Message, User
 from .forms import RoomForm, UserForm, MyUserCreationForm
 from .utils import validate_name
-
+from .pagination import KeysetPaginator, OffsetCursorPaginator, cached_count, decode_cursor, encode_cursor
+from . import avatars, catalogue, hashing, metrics, moderation, search
+from .messaging import post_message, message_cursor, message_payload, room_channel
+from .routers import pin_primary
+from .sqlite import WriteTimeout
+from .broker import get_broker
+from .conditional import cache_policy, room_page_etag, room_page_last_modified
+
+import asyncio
+import json
 import logging
+import math
+import time
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, sync_to_async
 
 logger = logging.getLogger(__name__)
 
+# Backend recorded in the session by login(); it checks passwords in base.hashing's pool.
+AUTH_BACKEND = 'base.backends.PooledModelBackend'
+
 @require_http_methods(["GET"])
 def index(request):
     q = request.GET.get('q', '')
-    rooms = Room.objects.filter(
-        Q(topic__name__icontains=q) |
-        Q(name__icontains=q) |
-        Q(description__icontains=q)
-    ).select_related('topic', 'host').prefetch_related('participants')
-    
-    topics = Topic.objects.all()[:5]
-    room_count = rooms.count()
-    room_messages = Message.objects.filter(
-        Q(room__topic__name__icontains=q) |
-        Q(room__name__icontains=q) |
-        Q(body__icontains=q)
-    ).select_related('user', 'room')
-
-    paginator = Paginator(rooms, 10)  # Show 10 rooms per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    cursor = request.GET.get('cursor')
+    per_page = settings.ROOM_FEED_PAGE_SIZE
+    rooms = Room.objects.select_related('topic', 'host')
+    room_messages = Message.objects.visible().select_related('user', 'room')
+
+    room_ids = search.search_room_ids(q) if q else None
+    if room_ids is not None:
+        # Ranked search hits are already a bounded id list: page through it.
+        room_messages = search.search_messages(room_messages, q)
+        paginator = OffsetCursorPaginator(room_ids, per_page, lambda ids: search.in_rank_order(rooms, ids))
+        room_count = len(room_ids)
+        # Hits stop at SEARCH_RESULT_LIMIT, so a full list means "at least".
+        room_count_capped = room_count >= search.result_limit()
+    else:
+        if q:
+            rooms = search.search_rooms(rooms, q)
+            room_messages = search.search_messages(room_messages, q)
+        paginator = KeysetPaginator(rooms, per_page)
+        room_count = cached_count(rooms, f'rooms:{q}')
+        room_count_capped = False
+    # Lazy, like the querysets: a cached feed fragment never runs the page query.
+    page_obj = SimpleLazyObject(lambda: paginator.page(cursor))
+
+    topics = catalogue.all_topics()[:5]
 
     context = {
+        'q': q,
         'rooms': page_obj,
         'topics': topics,
         'room_count': room_count,
-        'room_messages': room_messages
+        'room_count_capped': room_count_capped,
+        'room_messages': SimpleLazyObject(lambda: activity_feed(room_messages)),
+        'activity_url': activity_url(q=q),
     }
     return render(request, 'base/index.html', context)
 
+def activity_feed(room_messages, cursor=None):
+    """One page of "Recent Activities", newest first; the panels show the first one."""
+    return KeysetPaginator(room_messages, settings.ACTIVITY_FEED_SIZE).page(cursor)
+
+def activity_url(**params):
+    """The activity page, filtered by the non-empty ``params``."""
+    params = {name: value for name, value in params.items() if value}
+    return reverse('activity-page') + (f'?{urlencode(params)}' if params else '')
+
 @require_http_methods(["GET", "POST"])
 def login_page(request):
     if request.user.is_authenticated:
         return redirect('index')
 
+    status = 200
     if request.method == 'POST':
         email = request.POST.get('email', '').lower()
         password = request.POST.get('password', '')
 
         try:
+            hashing.throttle(request, email)
             user = authenticate(request, email=email, password=password)
             if user is not None:
-                auth_backend = 'django.contrib.auth.backends.ModelBackend'
-                login(request, user,backend= auth_backend)
+                hashing.reset_throttle(request, email)
+                login(request, user, backend=AUTH_BACKEND)
                 return redirect('index')
             else:
                 messages.error(request, _("Invalid email or password"))
+        except hashing.Throttled:
+            status = 429
+            messages.error(request, _("Too many login attempts. Please wait a few minutes and try again."))
+        except hashing.HashingBusy:
+            status = 503
+            messages.error(request, _("We are handling a lot of logins right now. Please try again."))
         except User.DoesNotExist:
             messages.error(request, _("User does not exist"))
         except Exception as e:
             logger.error(f"Login error: {str(e)}")
             messages.error(request, _("An error occurred. Please try again."))
 
-    return render(request, 'base/login_page.html', {'page': 'login'})
+    return render(request, 'base/login_page.html', {'page': 'login'}, status=status)
 
 @login_required(login_url='login')
 def logout_user(request):
@@ -79,18 +130,27 @@ def logout_user(request):
 @require_http_methods(["GET", "POST"])
 def register_user(request):
     form = MyUserCreationForm()
+    status = 200
 
     if request.method == "POST":
         form = MyUserCreationForm(request.POST)
+        try:
+            hashing.throttle(request, request.POST.get('email', ''))
+        except hashing.Throttled:
+            messages.error(request, _("Too many registration attempts. Please wait a few minutes and try again."))
+            return render(request, 'base/login_page.html', {'form': form}, status=429)
         if form.is_valid():
             try:
+                # Hash before opening the transaction; the pool may queue.
+                user = form.save(commit=False)
                 with transaction.atomic():
-                    user = form.save(commit=False)
                     user.username = user.username.lower()
                     user.save()
-                    auth_backend = 'django.contrib.auth.backends.ModelBackend'
-                    login(request, user,backend= auth_backend)
+                    login(request, user, backend=AUTH_BACKEND)
                 return redirect('index')
+            except hashing.HashingBusy:
+                status = 503
+                messages.error(request, _("We are handling a lot of sign-ups right now. Please try again."))
             except Exception as e:
                 logger.error(f"User registration error: {str(e)}")
                 messages.error(request, _("An error occurred during registration. Please try again."))
@@ -99,19 +159,22 @@ def register_user(request):
                 for error in errors:
                     messages.error(request, f"{field.capitalize()}: {error}")
 
-    return render(request, 'base/login_page.html', {'form': form})
+    return render(request, 'base/login_page.html', {'form': form}, status=status)
 
 @require_http_methods(["GET"])
 def user_profile(request, pk):
     user = get_object_or_404(User, id=pk)
-    rooms = user.rooms.all()
-    room_messages = user.messages.all()
-    topics = Topic.objects.all()
+    paginator = KeysetPaginator(user.rooms.select_related('topic', 'host'), settings.ROOM_FEED_PAGE_SIZE)
+    cursor = request.GET.get('cursor')
+    rooms = SimpleLazyObject(lambda: paginator.page(cursor))
+    room_messages = user.messages.visible().select_related('user', 'room')
+    topics = catalogue.all_topics()
     context = {
         'user': user,
         'rooms': rooms,
         'topics': topics,
-        'room_messages': room_messages
+        'room_messages': SimpleLazyObject(lambda: activity_feed(room_messages)),
+        'activity_url': activity_url(user=user.pk),
     }
     return render(request, 'base/userProfile.html', context)
 
@@ -130,7 +193,14 @@ def update_user(request, pk):
     if request.method == 'POST':
         form = UserForm(request.POST, request.FILES, instance=profile_user)
         if form.is_valid():
-            form.save()
+            user = form.save(commit=False)
+            avatar_changed = 'avatar' in form.changed_data
+            if avatar_changed:
+                # Thumbnails of the old avatar no longer apply; new ones are built off the request.
+                user.avatar_hash = ''
+            user.save()
+            if avatar_changed:
+                avatars.schedule(user)
             return redirect('user-profile', pk=profile_user.id)
         else:
             for field, errors in form.errors.items():
@@ -138,36 +208,72 @@ def update_user(request, pk):
                     messages.error(request, f"{field.capitalize()}: {error}")
     
     return render(request, 'base/update-user.html', {'form': form})
+@cache_control(**cache_policy('room'))
+@condition(etag_func=room_page_etag, last_modified_func=room_page_last_modified)
 @require_http_methods(["GET", "POST"])
 def room(request, pk):
     room = get_object_or_404(Room, id=pk)
-    room_messages = room.room_messages.all().select_related('user')
-    participants = room.participants.all()
 
+    status = 200
     if request.method == 'POST':
-        if request.user.is_authenticated:
-            Message.objects.create(
-                user=request.user,
-                room=room,
-                body=request.POST.get('message_body')
-            )
-            room.participants.add(request.user)
-            return redirect('room', pk=room.id)
-        else:
+        if not request.user.is_authenticated:
             return redirect('login')
+        body = request.POST.get('message_body', '')
+        if not body.strip():
+            status = 400
+            messages.error(request, _("A message cannot be empty."))
+        else:
+            try:
+                post_message(request.user, room, body)
+                return redirect('room', pk=room.id)
+            except WriteTimeout:
+                status = 503
+                messages.error(request, _("We are handling a lot of messages right now. Please send it again."))
+
+    # Only the newest window of messages; older ones load on demand.
+    before = request.GET.get('before')
+    room_messages = message_window(room, before)
+    participants = room.participants.all()
+    # Live updates start after the newest message, which an older window does not show.
+    newest = room.room_messages.visible().order_by('-created', '-pk').first() if before else (
+        room_messages.object_list[0] if room_messages.object_list else None
+    )
 
     context = {
         'room': room,
         'room_messages': room_messages,
-        'participants': participants
+        'participants': participants,
+        'after': message_cursor(newest) if newest else '',
     }
-    return render(request, 'base/room.html', context)
+    return render(request, 'base/room.html', context, status=status)
+
+def message_window(room, before=None):
+    """
+    One window of a room's messages, newest first, starting below the
+    ``before`` cursor. Messages are never edited, so (-created, -pk) gives
+    the same order as Message.Meta.ordering while using the (room, created)
+    index. Scrolling back past the hot messages continues into the archive.
+    """
+    messages = room.room_messages.visible().select_related('user')
+    archived = room.archived_messages.visible().select_related('user')
+    paginator = KeysetPaginator(messages, settings.ROOM_MESSAGE_WINDOW, ordering=('-created', '-pk'), older=archived)
+    return paginator.page(before)
+
+@require_http_methods(["GET"])
+def room_history(request, pk):
+    """JSON for the window of messages older than ``?before=<cursor>``."""
+    room = get_object_or_404(Room, id=pk)
+    window = message_window(room, request.GET.get('before'))
+    return JsonResponse({
+        'messages': [message_payload(message) for message in window],
+        'before': window.next_cursor,
+    })
 
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
 def create_room(request):
     form = RoomForm()
-    topics = Topic.objects.all()
+    topics = catalogue.all_topics()
 
     if request.method == "POST":
         topic_name = request.POST.get('topic')
@@ -189,7 +295,7 @@ def create_room(request):
 
         try:
             with transaction.atomic():
-                topic, _ = Topic.objects.get_or_create(name=topic_name)
+                topic, _created = catalogue.get_or_create_topic(topic_name)
                 room = Room.objects.create(
                     host=request.user,
                     topic=topic,
@@ -209,7 +315,7 @@ def create_room(request):
 def update_room(request, pk):
     room = get_object_or_404(Room, id=pk)
     form = RoomForm(instance=room)
-    topics = Topic.objects.all()
+    topics = catalogue.all_topics()
 
     if request.user != room.host:
         return HttpResponseForbidden(_("You are not allowed to update this room."))
@@ -230,7 +336,7 @@ def update_room(request, pk):
 
         try:
             with transaction.atomic():
-                topic, _ = Topic.objects.get_or_create(name=topic_name)
+                topic, _created = catalogue.get_or_create_topic(topic_name)
                 room.name = room_name
                 room.description = request.POST.get('description')
                 room.topic = topic
@@ -260,7 +366,8 @@ def delete_room(request, pk):
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
 def delete_message(request, pk):
-    message = get_object_or_404(Message, id=pk)
+    # Room history also shows archived messages; those are deleted from the archive.
+    message = Message.objects.filter(id=pk).first() or get_object_or_404(ArchivedMessage, id=pk)
 
     if request.user != message.user:
         return HttpResponseForbidden(_("You are not allowed to delete this message."))
@@ -285,14 +392,181 @@ def setting(request):
 @require_http_methods(["GET"])
 def activity_page(request):
     q = request.GET.get('q', '')
-    room_messages = Message.objects.filter(
-        Q(room__topic__name__icontains=q) |
-        Q(room__name__icontains=q)
-    ).select_related('user', 'room')
-    return render(request, 'base/activity_mobile.html', {'room_messages': room_messages})
+    try:
+        user_id = uuid.UUID(request.GET['user']) if request.GET.get('user') else None
+    except ValueError:
+        raise Http404
+    room_messages = Message.objects.visible().select_related('user', 'room')
+    if user_id:
+        room_messages = room_messages.filter(user_id=user_id)
+    if q:
+        room_ids = search.search_room_ids(q)
+        if room_ids is None:
+            room_messages = room_messages.filter(
+                Q(room__topic__name__icontains=q) |
+                Q(room__name__icontains=q)
+            )
+        else:
+            room_messages = room_messages.filter(room_id__in=room_ids)
+    page = activity_feed(room_messages, request.GET.get('cursor'))
+    next_url = activity_url(q=q, user=user_id, cursor=page.next_cursor) if page.has_next() else None
+    return render(request, 'base/activity_mobile.html', {'room_messages': page, 'next_url': next_url})
 
 @require_http_methods(["GET"])
 def topic_page(request):
     q = request.GET.get('q', '')
-    topics = Topic.objects.filter(name__icontains=q)
-    return render(request, 'base/topics_mobile.html', {'topics': topics})
\ No newline at end of file
+    topics = catalogue.topics_with_prefix(q)
+    return render(request, 'base/topics_mobile.html', {'topics': topics})
+
+
+def _messages_after(room_id, cursor, limit):
+    """
+    Payloads for messages in a room posted after ``cursor``, oldest first,
+    plus the cursor for the last one. Without a cursor, the newest ``limit``
+    messages. One range query on the Message(room, created) index.
+    """
+    messages = Message.objects.visible().filter(room_id=room_id).select_related('user')
+    values, _direction = decode_cursor(cursor)
+    if values and len(values) == 2:
+        created, pk = values
+        messages = messages.filter(Q(created__gt=created) | Q(created=created, pk__gt=pk))
+        messages = list(messages.order_by('created', 'pk')[:limit])
+    else:
+        messages = list(messages.order_by('-created', '-pk')[:limit])[::-1]
+    payloads = [message_payload(message) for message in messages]
+    if messages:
+        cursor = message_cursor(messages[-1])
+    return payloads, cursor
+
+
+async def _wait_for_messages(room_id, cursor, timeout):
+    """
+    Return messages after ``cursor``, waiting up to ``timeout`` seconds for
+    one to arrive. Streams call this long after ReplicaRoutingMiddleware has
+    returned, and each wake-up is for a write just committed on the primary,
+    so the reads are pinned there: a lagging replica would not have it yet.
+    """
+    # Subscribe before querying so nothing posted in between is missed.
+    subscription = await get_broker().subscribe(room_channel(room_id))
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with pin_primary():
+                payloads, cursor = await sync_to_async(_messages_after)(
+                    room_id, cursor, settings.MESSAGES_SINCE_LIMIT,
+                )
+            remaining = deadline - loop.time()
+            if payloads or remaining <= 0:
+                return payloads, cursor
+            try:
+                await asyncio.wait_for(subscription.get(), remaining)
+            except asyncio.TimeoutError:
+                return [], cursor
+    finally:
+        subscription.close()
+
+
+async def _get_room_id(pk):
+    room_id = await sync_to_async(
+        lambda: Room.objects.filter(pk=pk).values_list('pk', flat=True).first()
+    )() if pk.isdigit() else None
+    if room_id is None:
+        raise Http404("No Room matches the given query.")
+    return room_id
+
+
+@require_http_methods(["GET"])
+async def room_messages_since(request, pk):
+    """
+    JSON list of messages posted in a room after ``?after=<cursor>``. With
+    ``?wait=<seconds>`` the request long-polls until a message arrives or
+    the wait (capped at LONG_POLL_TIMEOUT) runs out.
+    """
+    room_id = await _get_room_id(pk)
+    cursor = request.GET.get('after')
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    # NaN gets through min()/max() and would make the wait endless.
+    wait = min(max(wait, 0), settings.LONG_POLL_TIMEOUT) if math.isfinite(wait) else 0
+
+    if wait:
+        payloads, cursor = await _wait_for_messages(room_id, cursor, wait)
+    else:
+        payloads, cursor = await sync_to_async(_messages_after)(room_id, cursor, settings.MESSAGES_SINCE_LIMIT)
+    return JsonResponse({'messages': payloads, 'cursor': cursor})
+
+
+def _sse_events(payloads):
+    if not payloads:
+        yield ': keepalive\n\n'
+    for payload in payloads:
+        # Each event's own cursor, so a reconnect resumes right after the last one received.
+        yield f'id: {payload["cursor"]}\nevent: message\ndata: {json.dumps(payload)}\n\n'
+
+
+async def _event_stream(room_id, cursor):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SSE_MAX_DURATION
+    yield 'retry: 3000\n\n'
+    while loop.time() < deadline:
+        payloads, cursor = await _wait_for_messages(room_id, cursor, settings.SSE_KEEPALIVE)
+        for event in _sse_events(payloads):
+            yield event
+
+
+def _event_stream_sync(room_id, cursor):
+    """
+    ``_event_stream`` for WSGI servers, which would otherwise buffer an async
+    stream until it ends. Each wait runs in its own short-lived event loop;
+    the stream holds one server thread for as long as it is open.
+    """
+    deadline = time.monotonic() + settings.SSE_MAX_DURATION
+    yield 'retry: 3000\n\n'
+    while time.monotonic() < deadline:
+        payloads, cursor = async_to_sync(_wait_for_messages)(room_id, cursor, settings.SSE_KEEPALIVE)
+        yield from _sse_events(payloads)
+
+
+@require_http_methods(["GET"])
+async def room_events(request, pk):
+    """
+    Server-Sent Events stream of new messages in a room. Resumes from the
+    ``Last-Event-ID`` header or ``?after=<cursor>``; the stream ends after
+    SSE_MAX_DURATION seconds and the browser reconnects where it left off.
+    """
+    room_id = await _get_room_id(pk)
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    # Django only streams an iterator of the server's own kind; the other is collected first.
+    stream = _event_stream if isinstance(request, ASGIRequest) else _event_stream_sync
+    response = StreamingHttpResponse(stream(room_id, cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def moderation_metrics(request):
+    """Moderation backlog, lag and worker throughput as JSON."""
+    return JsonResponse(moderation.metrics())
+
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    """
+    Request metrics for Prometheus. Internal: with METRICS_TOKEN set, only
+    scrapers sending it as a bearer token get an answer; without it, only
+    METRICS_ALLOWED_IPS. That check is on REMOTE_ADDR, which behind a
+    reverse proxy is the proxy's address for every client, so a proxied
+    deployment needs the token.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        raise Http404
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,120 @@
+"""
+WebSocket endpoint for live room updates, mounted by ``studybuddy/asgi.py``.
+
+``/ws/room/<pk>/`` subscribes to the room's broker channel and forwards each
+published frame as JSON text. Signed-in users can also post by sending
+``{"body": "..."}``; the message is stored exactly like a form POST to the
+room view and reaches every subscriber through the broker.
+"""
+
+import asyncio
+import json
+import re
+from http import cookies
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+
+from .broker import get_broker
+from .messaging import post_message, room_channel
+from .models import Room
+from .sqlite import WriteTimeout
+
+ROOM_PATH = re.compile(r'^/ws/room/(?P<pk>[^/]+)/$')
+
+# Application-level close codes (4000-4999 are free for apps to use).
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+
+def _db(func):
+    """Run ``func`` in Django's sync thread, with the usual connection cleanup."""
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+@_db
+def _load(room_id, headers):
+    room = Room.objects.filter(pk=room_id).first() if room_id.isdigit() else None
+    cookie = cookies.SimpleCookie(headers.get('cookie', ''))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value if morsel else None)
+    return room, get_user(SimpleNamespace(session=session))
+
+
+@_db
+def _post(user, room, body):
+    post_message(user, room, body)
+
+
+def _same_origin(headers):
+    """Reject cross-site pages trying to post with the visitor's session cookie."""
+    origin = headers.get('origin')
+    return origin is None or urlparse(origin).netloc == headers.get('host')
+
+
+async def websocket_application(scope, receive, send):
+    match = ROOM_PATH.match(scope['path'])
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    headers = _headers(scope)
+    room, user = await _load(match['pk'], headers)
+    if room is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    can_post = user.is_authenticated and _same_origin(headers)
+
+    await send({'type': 'websocket.accept'})
+    subscription = await get_broker().subscribe(room_channel(room.pk))
+    receiving = asyncio.ensure_future(receive())
+    forwarding = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _pending = await asyncio.wait({receiving, forwarding}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarding in done:
+                await send({'type': 'websocket.send', 'text': json.dumps(forwarding.result())})
+                forwarding = asyncio.ensure_future(subscription.get())
+            if receiving in done:
+                event = receiving.result()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive':
+                    await _handle_frame(event, user, room, can_post, send)
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        subscription.close()
+        receiving.cancel()
+        forwarding.cancel()
+
+
+async def _handle_frame(event, user, room, can_post, send):
+    try:
+        body = json.loads(event.get('text') or '{}').get('body', '').strip()
+    except (ValueError, AttributeError):
+        body = ''
+    if not can_post:
+        await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', 'error': 'login required'})})
+    elif body:
+        try:
+            await _post(user, room, body)
+        except WriteTimeout:
+            await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', 'error': 'busy, send again'})})
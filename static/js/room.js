@@ -0,0 +1,154 @@
+// Live room updates: new and deleted messages arrive as JSON frames over a
+// WebSocket, and the message form posts through the socket while it is open.
+// If a socket cannot be opened, new messages come from the Server-Sent Events
+// stream instead, and posting uses the normal form POST. Every message
+// carries a cursor; whenever a socket (re)opens, anything posted after the
+// last one seen is fetched first, and the event stream resumes from its
+// last event id, so nothing posted while disconnected is lost.
+(function () {
+  const threads = document.querySelector('.threads[data-room]');
+  if (!threads) return;
+
+  const form = document.querySelector('.room__message form');
+  const input = document.getElementById('message_body');
+  const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+  const url = `${scheme}://${window.location.host}/ws/room/${threads.dataset.room}/`;
+  let socket = null;
+  // Cursor of the newest message shown; see base.messaging.message_cursor.
+  let after = threads.dataset.after || '';
+
+  function renderMessage(message) {
+    const thread = document.createElement('div');
+    thread.className = 'thread';
+    thread.dataset.messageId = message.id;
+
+    const top = document.createElement('div');
+    top.className = 'thread__top';
+    const author = document.createElement('div');
+    author.className = 'thread__author';
+    const link = document.createElement('a');
+    link.className = 'thread__authorInfo';
+    link.href = `/user-profile/${message.user.id}/`;
+    const avatar = document.createElement('div');
+    avatar.className = 'avatar avatar--small';
+    const img = document.createElement('img');
+    img.src = message.user.avatar;
+    img.alt = 'user-profile';
+    avatar.appendChild(img);
+    const name = document.createElement('span');
+    name.textContent = `@${message.user.username}`;
+    link.append(avatar, name);
+    const date = document.createElement('span');
+    date.className = 'thread__date';
+    date.textContent = 'just now';
+    author.append(link, date);
+    top.appendChild(author);
+
+    if (threads.dataset.user && threads.dataset.user === message.user.id) {
+      const remove = document.createElement('div');
+      remove.className = 'thread__delete';
+      const removeLink = document.createElement('a');
+      removeLink.href = `/delete-message/${message.id}/`;
+      removeLink.textContent = '×';
+      remove.appendChild(removeLink);
+      top.appendChild(remove);
+    }
+
+    const details = document.createElement('div');
+    details.className = 'thread__details';
+    details.textContent = message.body;
+    thread.append(top, details);
+    return thread;
+  }
+
+  function showMessage(message) {
+    if (message.cursor) after = message.cursor;
+    if (!threads.querySelector(`[data-message-id="${message.id}"]`)) {
+      // Newest messages are listed first.
+      threads.prepend(renderMessage(message));
+    }
+  }
+
+  function handleFrame(event) {
+    const frame = JSON.parse(event.data);
+    if (frame.type === 'message') {
+      showMessage(frame);
+    } else if (frame.type === 'message.deleted') {
+      const thread = threads.querySelector(`[data-message-id="${frame.id}"]`);
+      if (thread) thread.remove();
+    }
+  }
+
+  function query() {
+    // Without a cursor the server replays the latest messages.
+    return after ? `?${new URLSearchParams({ after: after })}` : '';
+  }
+
+  // Fetch what was posted after the last message seen, a page at a time.
+  function backfill() {
+    fetch(`/room/${threads.dataset.room}/messages/${query()}`)
+      .then((response) => response.json())
+      .then((data) => {
+        data.messages.forEach(showMessage);
+        if (data.messages.length) backfill();
+      });
+  }
+
+  function listenForEvents() {
+    if (!('EventSource' in window)) return;
+    // The browser reconnects by itself, sending the last event id to resume from.
+    const events = new EventSource(`/room/${threads.dataset.room}/events/${query()}`);
+    events.addEventListener('message', handleFrame);
+  }
+
+  function connect() {
+    if (!('WebSocket' in window)) {
+      listenForEvents();
+      return;
+    }
+    let opened = false;
+    socket = new WebSocket(url);
+    socket.addEventListener('open', () => {
+      opened = true;
+      backfill();
+    });
+    socket.addEventListener('message', handleFrame);
+    socket.addEventListener('close', () => {
+      socket = null;
+      // Never opened: no WebSocket support on this deployment, fall back to SSE.
+      if (opened) setTimeout(connect, 3000);
+      else listenForEvents();
+    });
+  }
+
+  // "Load older messages" fetches the next window instead of reloading the page.
+  threads.addEventListener('click', (event) => {
+    const older = event.target.closest('.threads__older');
+    if (!older) return;
+    event.preventDefault();
+    const params = new URLSearchParams({ before: older.dataset.before });
+    fetch(`${older.dataset.history}?${params}`)
+      .then((response) => response.json())
+      .then((data) => {
+        data.messages.forEach((message) => {
+          if (!threads.querySelector(`[data-message-id="${message.id}"]`)) {
+            threads.insertBefore(renderMessage(message), older);
+          }
+        });
+        if (data.before) older.dataset.before = data.before;
+        else older.remove();
+      });
+  });
+
+  if (form && input) {
+    form.addEventListener('submit', (event) => {
+      const body = input.value.trim();
+      if (!socket || socket.readyState !== WebSocket.OPEN || !threads.dataset.user) return;
+      event.preventDefault();
+      if (body) socket.send(JSON.stringify({ body: body }));
+      input.value = '';
+    });
+  }
+
+  connect();
+})();
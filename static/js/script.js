@@ -67,3 +67,11 @@ if (photoInput)
 // Scroll to Bottom
 const conversationThread = document.querySelector(".room__box");
 if (conversationThread) conversationThread.scrollTop = conversationThread.scrollHeight;
+
+// Cached fragments render owner-only controls hidden for everyone; reveal ours.
+const currentUser = document.body.dataset.user;
+if (currentUser) {
+  document.querySelectorAll(`[data-owner="${currentUser}"]`).forEach((element) => {
+    element.hidden = false;
+  });
+}
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config # this is for using Environment Variable in the setting file.
+from decouple import Csv, config # this is for using Environment Variable in the setting file.
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,7 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'base.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,7 +69,8 @@ ROOT_URLCONF = 'studybuddy.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the request metrics (base/metrics.py).
+        'BACKEND': 'base.metrics.TimedDjangoTemplates',
         'DIRS': ['templates', BASE_DIR/'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'base.context_processors.fragment_cache',
             ],
         },
     },
@@ -92,9 +96,54 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests (0 closes them after each one);
+        # health checks replace connections the server dropped meanwhile.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Behind an external pooler such as PgBouncer in transaction mode, set
+# DB_POOLER=True so Django does not rely on server-side cursors.
+if config('DB_POOLER', default=False, cast=bool):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Read replicas, routed by base/routers.py: a comma-separated list of database
+# files (SQLite) or hosts (other engines), e.g. DB_REPLICAS=replica.sqlite3.
+for _i, _replica in enumerate(config('DB_REPLICAS', default='', cast=Csv())):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        _target = {'NAME': BASE_DIR / _replica}
+    else:
+        _target = {'HOST': _replica}
+    DATABASES[f'replica_{_i}'] = {**DATABASES['default'], **_target, 'TEST': {'MIRROR': 'default'}}
+
+# SQLite production mode (base/sqlite.py): applied to every new SQLite connection.
+# Set SQLITE_PRAGMAS = {} to keep SQLite's defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers do not block on a committing writer
+    'synchronous': 'NORMAL',  # safe with WAL; fsync at checkpoints only
+    'busy_timeout': 5000,  # ms to wait for the write lock before "database is locked"
+    'mmap_size': 256 * 1024 * 1024,
+}
+# Post room messages through one writer thread that group-commits them.
+SQLITE_WRITE_QUEUE = True
+SQLITE_WRITE_BATCH_SIZE = 100  # messages per grouped transaction
+SQLITE_WRITE_TIMEOUT = 10  # seconds a request waits for its message to commit
+
+# Cache shared by every worker process: sessions, login throttling, fragment
+# versions and the topic catalogue rely on it. Point CACHE_URL at a Redis server,
+# e.g. CACHE_URL=redis://localhost:6379/1; without it each process gets its own
+# in-memory cache, which is only right for a single process (runserver, tests).
+# `manage.py check --deploy` warns about that.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+DATABASE_ROUTERS = ['base.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # reads stay on the primary this long after a client's POST
+
 # This is Hosted on Aiven.io , currently using 30 day free trial later need to modify
 # cloud Hosted Production Based Database
 # DATABASES = {
@@ -147,12 +196,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 AUTH_USER_MODEL = 'base.User'
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'base.backends.PooledModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
+    # Still listed so sessions logged in through it stay valid.
+    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Password hashing pool for login and registration (base/hashing.py)
+PASSWORD_HASH_WORKERS = 2  # processes; 0 hashes on the request thread
+PASSWORD_HASH_QUEUE = 16  # calls that may wait for a worker
+PASSWORD_HASH_TIMEOUT = 5  # seconds to wait for a queue slot before HashingBusy
+# Per-email and per-IP attempt limits, counted in the default cache (shared with CACHE_URL).
+AUTH_THROTTLE = {
+    'email': (5, 5 * 60),  # attempts per window (seconds)
+    'ip': (30, 5 * 60),
+}
+
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # 1 week
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Cache-first sessions that skip no-op saves (base/sessions.py); the cache is only
+# used when it is shared (CACHE_URL). Expired rows are removed with
+# `manage.py purge_sessions`.
+SESSION_ENGINE = 'base.sessions'
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -181,3 +245,76 @@ MEDIA_URL = '/images/'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Full-text search (base/search.py): maximum number of ranked hits returned per query.
+SEARCH_RESULT_LIMIT = 200
+
+# Rooms per page on the home feed (keyset paginated, see base/pagination.py).
+ROOM_FEED_PAGE_SIZE = 10
+# Messages per page of "Recent Activities": the home and profile panels show the
+# first page and link to the activity page, which pages through the rest.
+ACTIVITY_FEED_SIZE = 20
+
+# Report `manage.py benchmark` compares against (base/benchmarks.py).
+BENCHMARK_BASELINE = BASE_DIR / 'benchmarks' / 'baseline.json'
+
+# Request metrics at /metrics/ in the Prometheus text format (base/metrics.py).
+# With several worker processes, point METRICS_DIR at a directory they share
+# (emptied on deploy) so the endpoint reports all of them.
+METRICS_DIR = config('METRICS_DIR', default='') or None
+METRICS_FLUSH_INTERVAL = 5  # seconds between a process's writes to METRICS_DIR
+# Who may read /metrics/: with METRICS_TOKEN set, only scrapers sending
+# "Authorization: Bearer <token>"; otherwise only METRICS_ALLOWED_IPS. The IP
+# check uses REMOTE_ADDR, which behind a reverse proxy on this host is the
+# proxy's address for everyone, so always set a token in that setup.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Live room updates over WebSockets (base/broker.py). The in-process broker only
+# reaches clients connected to the same worker; use RedisBroker (needs the `redis`
+# package from requirements.txt) when running several.
+REALTIME_BROKER = {
+    'BACKEND': 'base.broker.InProcessBroker',
+    # 'BACKEND': 'base.broker.RedisBroker',
+    # 'OPTIONS': {'url': 'redis://localhost:6379/0'},
+}
+
+# Incremental "messages since" endpoints (room-messages-since / room-events).
+MESSAGES_SINCE_LIMIT = 100   # most messages returned per response
+LONG_POLL_TIMEOUT = 25       # seconds a ?wait= request may hold the connection
+SSE_KEEPALIVE = 15           # seconds between keepalive comments on an idle stream
+SSE_MAX_DURATION = 300       # seconds before an event stream closes and the client reconnects
+
+# Messages rendered per window on the room page; older ones load on demand.
+ROOM_MESSAGE_WINDOW = 50
+MESSAGE_ARCHIVE_AFTER_DAYS = 90  # `manage.py archive_messages` moves older messages to the archive table
+
+# Avatar thumbnails (base/avatars.py): threads rendering variants after an upload.
+# Variants live under MEDIA_ROOT/avatars/<content hash>/ and never change, so the
+# web server can serve them with a long Cache-Control max-age.
+AVATAR_WORKERS = 2
+
+# Background message moderation (base/moderation.py, manage.py moderate_messages).
+MODERATION_ACTION = 'hide'      # 'hide' removes offending messages from view, 'flag' only marks them
+MODERATION_WORKERS = 2
+MODERATION_BATCH_SIZE = 500
+
+# REST API (base/api): rooms per page by default and at most (?limit=), and rows
+# fetched per round trip when streaming NDJSON.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+API_STREAM_CHUNK_SIZE = 500
+
+# Cache-Control directives per endpoint (see base/conditional.py). Room pages are
+# per-user, so browsers may keep them but must revalidate (cheap, thanks to ETags);
+# API responses are the same for everyone and can sit briefly in shared caches.
+CACHE_CONTROL_POLICIES = {
+    'room': {'private': True, 'no_cache': True},
+    'api-room': {'public': True, 'max_age': 5, 'must_revalidate': True},
+    'api-rooms': {'public': True, 'max_age': 5},
+}
+API_MAX_BATCH_SIZE = 100  # ids or messages per batch API request
+
+# Cached topic/feed/activity fragments (base/fragments.py). Versions invalidate them
+# on writes; the TTL only bounds how stale "N minutes ago" labels can get.
+FRAGMENT_CACHE_TTL = 60